@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the generator's hot paths.  Results are written as JSON so
+# runs from different versions can be compared with --compare.
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from generator import (BACKGROUNDS, BONUS_REGISTRY, PROFESSIONS,
+                       Need2KnowCharacter, Need2KnowPDF, generate)
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generator.py')
+
+# The serial JPEG path every other configuration is compared against
+BASELINE = ('jpeg', 1)
+
+
+def rate(count, seconds):
+    return count / seconds if seconds else float('inf')
+
+
+def bench_characters(count):
+    # Need2KnowCharacter construction per profession and per bonus package
+    professions = {}
+    for profession in PROFESSIONS:
+        start = time.perf_counter()
+        for x in range(count):
+            Need2KnowCharacter('male', profession, '')
+        seconds = time.perf_counter() - start
+        professions[profession] = {'agents_per_sec': rate(count, seconds),
+                                   'us_per_agent': seconds / count * 1e6}
+    bonuses = {}
+    for bonus in sorted(BONUS_REGISTRY):
+        start = time.perf_counter()
+        for x in range(count):
+            Need2KnowCharacter('male', 'Nurse', bonus)
+        seconds = time.perf_counter() - start
+        bonuses[bonus] = {'agents_per_sec': rate(count, seconds),
+                          'us_per_agent': seconds / count * 1e6}
+    return professions, bonuses
+
+
+def bench_pdf(pages, backgrounds):
+    # Need2KnowPDF.add_page and save_pdf per background, in memory
+    results = {}
+    characters = list(generate(PROFESSIONS, 1, 'b', 'random'))
+    for background in backgrounds:
+        buf = io.BytesIO()
+        p = Need2KnowPDF(buf, background=background)
+        start = time.perf_counter()
+        for n in range(pages):
+            p.add_page(characters[n % len(characters)])
+        add_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        p.save_pdf()
+        save_seconds = time.perf_counter() - start
+        results[background] = {
+            'add_page_per_sec': rate(pages, add_seconds),
+            'add_page_ms': add_seconds / pages * 1e3,
+            'save_pdf_seconds': save_seconds,
+            'bytes_per_page': len(buf.getvalue()) / (pages + 1),
+        }
+    return results
+
+
+def run_cli(agents, background, jobs, workdir):
+    # One end-to-end run of generator.py in a child process, measuring wall
+    # time and the child's own peak RSS
+    output = os.path.join(workdir, 'bench-%d-%s-%d.pdf' % (agents, background, jobs))
+    per_profession = max(1, agents // len(PROFESSIONS))
+    if agents < len(PROFESSIONS):
+        args = ['-p', PROFESSIONS[0], '-n', str(agents)]
+    else:
+        args = ['-n', str(per_profession)]
+        agents = per_profession * len(PROFESSIONS)
+    command = [sys.executable, SCRIPT, output, '-s', 'm', '--seed', 'bench',
+               '--background', background, '-j', str(jobs)] + args
+    start = time.perf_counter()
+    child = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+    pid, status, usage = os.wait4(child.pid, 0)
+    seconds = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError('generator.py failed: ' + ' '.join(command))
+    size = os.path.getsize(output)
+    os.remove(output)
+    # ru_maxrss is in kilobytes on Linux but bytes on macOS
+    peak = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return {
+        'agents': agents,
+        'background': background,
+        'jobs': jobs,
+        'seconds': seconds,
+        'agents_per_sec': rate(agents, seconds),
+        'peak_rss_kb': peak,
+        # the back page is part of the file too
+        'bytes_per_page': size / (agents + 1),
+    }
+
+
+def bench_cli(sizes, backgrounds, jobs_list):
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for agents in sizes:
+            baseline = None
+            for background in backgrounds:
+                for jobs in jobs_list:
+                    run = run_cli(agents, background, jobs, workdir)
+                    if (background, jobs) == BASELINE:
+                        baseline = run
+                    runs.append(run)
+                    print('cli %6d agents %-6s jobs %d: %8.2f s %8.1f agents/s '
+                          '%7d KB peak %9.0f bytes/page' % (
+                              run['agents'], background, jobs, run['seconds'],
+                              run['agents_per_sec'], run['peak_rss_kb'],
+                              run['bytes_per_page']))
+            if baseline is not None:
+                for run in runs:
+                    if run['agents'] == baseline['agents']:
+                        run['speedup_vs_baseline'] = (baseline['seconds'] /
+                                                      run['seconds'])
+    return runs
+
+
+def flatten(results):
+    # Every throughput figure of a result file, keyed by a readable path
+    rates = {}
+    for section in ('professions', 'bonus_packages'):
+        for name, result in results.get(section, {}).items():
+            rates['%s/%s' % (section, name)] = result['agents_per_sec']
+    for background, result in results.get('pdf', {}).items():
+        rates['pdf/%s/add_page' % background] = result['add_page_per_sec']
+    for run in results.get('cli', []):
+        rates['cli/%d/%s/%d' % (run['agents'], run['background'],
+                                run['jobs'])] = run['agents_per_sec']
+    return rates
+
+
+def compare(previous, current, tolerance):
+    # Print throughput changes against an earlier result file and return
+    # the keys that got slower than tolerance allows
+    old = flatten(previous)
+    new = flatten(current)
+    regressions = []
+    for key in sorted(set(old) & set(new)):
+        ratio = new[key] / old[key] if old[key] else float('inf')
+        mark = ''
+        if ratio < 1 - tolerance:
+            mark = '  REGRESSION'
+            regressions.append(key)
+        print('%-50s %6.2fx%s' % (key, ratio, mark))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", default='benchmark.json',
+                        help="JSON results file")
+    parser.add_argument("--agents", default='1,100,1000,10000',
+                        help="comma separated roster sizes for CLI runs")
+    parser.add_argument("--backgrounds", default=','.join(BACKGROUNDS),
+                        help="comma separated backgrounds to time")
+    parser.add_argument("--jobs", default='1',
+                        help="comma separated --jobs values for CLI runs")
+    parser.add_argument("--count", type=int, default=2000,
+                        help="agents per profession and bonus package timing")
+    parser.add_argument("--pages", type=int, default=200,
+                        help="pages per add_page timing")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed slowdown before --compare fails")
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.agents.split(',') if n]
+    backgrounds = [b for b in args.backgrounds.split(',') if b]
+    jobs_list = [int(n) for n in args.jobs.split(',') if n]
+
+    professions, bonuses = bench_characters(args.count)
+    print('character construction: %.1f agents/s (slowest %s)' % (
+        min(r['agents_per_sec'] for r in professions.values()),
+        min(professions, key=lambda p: professions[p]['agents_per_sec'])))
+    pdf = bench_pdf(args.pages, backgrounds)
+    for background, result in pdf.items():
+        print('%-6s add_page %.2f ms, save_pdf %.2f s, %.0f bytes/page' % (
+            background, result['add_page_ms'], result['save_pdf_seconds'],
+            result['bytes_per_page']))
+
+    results = {
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'professions': professions,
+        'bonus_packages': bonuses,
+        'pdf': pdf,
+        'cli': bench_cli(sizes, backgrounds, jobs_list),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('results written to', args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, results, args.tolerance):
+            sys.exit(1)
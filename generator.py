@@ -2,16 +2,117 @@
 
 import csv
 import datetime
-from random import randint, shuffle, choice, sample
+import hashlib
+import importlib
+import io
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import MutableMapping, Sequence
+from collections import deque
+from contextlib import contextmanager, redirect_stdout
+from fractions import Fraction
+from itertools import combinations
+from urllib.parse import parse_qs, urlparse
+import random
+from random import choice
+import PyPDF2
 from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject,
+                            IndirectObject, NameObject, NumberObject,
+                            StreamObject, TextStringObject)
+import reportlab
+from reportlab import rl_config
+from reportlab.lib.rl_accel import fp_str
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import argparse
+import cProfile
+import sys
+import time
+
+# pdfrw is only needed to import the vector character sheet
+try:
+    from pdfrw import PdfArray, PdfDict, PdfReader
+    from pdfrw.buildxobj import pagexobj
+    from pdfrw.toreportlab import makerl
+except ImportError:
+    PdfReader = None
+
+
+def optional_import(name):
+    # Heavy optional dependencies (numpy, pyarrow) are imported on first
+    # use so that importing this module stays cheap
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
 
 TEXT_COLOR = (0, .1, .5)
 DEFAULT_FONT = 'Special Elite'
 
+# Data files live next to this script, whatever the working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Precompiled name tables; set DGGEN_CACHE to '' to disable
+CACHE_DIR = os.environ.get('DGGEN_CACHE', os.path.join(DATA_DIR, 'cache'))
+
+# Rendered pages of seeded rosters, see PageCache, in chunks of CACHE_BLOCK
+PAGE_CACHE_DIR = os.path.join(CACHE_DIR or os.path.join(DATA_DIR, 'cache'),
+                              'pages')
+CACHE_BLOCK = 16
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def atomic_write(path, data):
+    # Write data to a temporary name and rename it over path, so readers
+    # and concurrent runs never see a half-written file
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# Character sheet backgrounds, front then back
+SHEET_JPEGS = (data_path('Character Sheet NO BACKGROUND FRONT.jpg'),
+               data_path('Character Sheet NO BACKGROUND BACK.jpg'))
+SHEET_PDF = data_path('Character Sheet NO BACKGROUND.pdf')
+FONT_FILES = {
+    DEFAULT_FONT: 'SpecialElite.ttf',
+    'OCRA': 'OCRA.ttf',
+}
+# Every character DGGen draws: the name, town and feature tables, the
+# labels and the numbers are all printable ASCII.  Each document embeds
+# the subset of the fonts covering all of it, see SubsetFont
+FONT_CHARSET = ''.join(map(chr, range(32, 127)))
+FONT_SUBSET_DIR = os.path.join(CACHE_DIR or os.path.join(DATA_DIR, 'cache'),
+                               'fonts')
+BACKGROUNDS = ('jpeg', 'vector', 'stamp')
+
+# Output formats; everything but pdf writes one row per agent
+FORMATS = ('pdf', 'jsonl', 'csv', 'columnar')
+
+# Sheet fields holding text, every other field is an integer
+TEXT_FIELDS = ('name', 'profession', 'nationality', 'age', 'birthday',
+               'male', 'female', 'damage bonus')
+
+
+
+def is_text_field(field):
+    return field in TEXT_FIELDS or field.endswith('label')
+
+
+# Rows buffered per write for the row-based and columnar exports
+EXPORT_BUFFER = 1 << 20
+ROW_GROUP = 65536
+
 MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
           'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
 
@@ -42,27 +143,1594 @@ PROFESSIONS = [
     'Special Operator',
 ]
 
-# Read names and places
-with open('data/boys1986.txt') as f:
-    MALES = f.read().splitlines()
+# Names and places, one per line.  Tables are read on first use and are
+# still reachable as module attributes (generator.SURNAMES and so on).
+TABLE_FILES = {
+    'MALES': 'boys1986.txt',
+    'FEMALES': 'girls1986.txt',
+    'SURNAMES': 'surnames.txt',
+    'TOWNS': 'towns.txt',
+}
+_TABLES = {}
+
+# Optional weights for the tables, name frequencies or town populations:
+# one entry, a tab and its weight per line.  Entries a weights file leaves
+# out are never drawn, tables without one are drawn uniformly.  See pick()
+WEIGHT_FILES = {
+    'MALES': 'boys1986.weights',
+    'FEMALES': 'girls1986.weights',
+    'SURNAMES': 'surnames.weights',
+    'TOWNS': 'towns.weights',
+}
+_PICKERS = {}
+
+
+class StringTable(Sequence):
+    # Read-only list of strings backed by a memory-mapped cache file:
+    # header, count + 1 uint32 offsets, then the UTF-8 blob
+    MAGIC = b'DGGS\x01'
+    HEADER = struct.Struct('<5sqqI')
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.mtime, self.size, self.count = self.HEADER.unpack_from(self.mm)
+        if magic != self.MAGIC:
+            raise ValueError('not a string table: ' + path)
+        start = self.HEADER.size
+        self.blob = start + 4 * (self.count + 1)
+        self.offsets = memoryview(self.mm)[start:self.blob].cast('I')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[n] for n in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('string table index out of range')
+        return self.mm[self.blob + self.offsets[i]:
+                       self.blob + self.offsets[i + 1]].decode('utf-8')
+
+    @classmethod
+    def build(cls, path, source, strings):
+        stat = os.stat(source)
+        blob = bytearray()
+        offsets = [0]
+        for s in strings:
+            blob += s.encode('utf-8')
+            offsets.append(len(blob))
+        atomic_write(path, cls.HEADER.pack(cls.MAGIC, stat.st_mtime_ns,
+                                           stat.st_size, len(strings)) +
+                     struct.pack('<%dI' % len(offsets), *offsets) + blob)
+
+    def is_current(self, source):
+        stat = os.stat(source)
+        return self.mtime == stat.st_mtime_ns and self.size == stat.st_size
+
+
+def cached_strings(filename, parse):
+    # parse(file) of a data file, a list of strings, through the binary
+    # cache when it is usable
+    source = data_path(filename)
+    if CACHE_DIR:
+        path = os.path.join(CACHE_DIR, filename + '.bin')
+        try:
+            table = StringTable(path)
+            if table.is_current(source):
+                return table
+        except (OSError, ValueError, struct.error):
+            pass
+    with open(source) as f:
+        strings = parse(f)
+    if CACHE_DIR:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            StringTable.build(path, source, strings)
+        except OSError:
+            pass
+    return strings
+
+
+def load_lines(filename):
+    # Lines of a data file, through the binary cache when it is usable
+    return cached_strings(filename, lambda f: f.read().splitlines())
+
+
+class FeatureTable(object):
+    # The distinguishing features compiled into one slot per statistic and
+    # value 0-18: slots[FeatureTable.slot(stat, value)] is the tuple of
+    # features to pick from, ('',) when there are none so that a pick
+    # consumes the same random draw either way.  starts and counts lay the
+    # same out over one flat tuple for sampling whole batches at once.
+    STATS = ('strength', 'constitution', 'dexterity', 'intelligence',
+             'power', 'charisma')
+    VALUES = 19
+    SEPARATOR = '\x1f'
+    EMPTY = ('',)
+
+    def __init__(self, slots):
+        self.slots = [tuple(features) or self.EMPTY for features in slots]
+        self.flat = []
+        self.starts = array('H')
+        self.counts = array('H')
+        for features in self.slots:
+            self.starts.append(len(self.flat))
+            self.counts.append(len(features))
+            self.flat.extend(features)
+        self.flat = tuple(self.flat)
+        self.index = {stat: n * self.VALUES
+                      for n, stat in enumerate(self.STATS)}
+
+    @classmethod
+    def parse(cls, f):
+        # One string per slot of the CSV, features joined by SEPARATOR;
+        # the form the binary cache stores
+        slots = [[] for x in range(len(cls.STATS) * cls.VALUES)]
+        for row in csv.DictReader(f):
+            base = cls.STATS.index(row['statistic']) * cls.VALUES
+            for value in range(int(row['from']), int(row['to']) + 1):
+                slots[base + value].append(row['distinguishing'])
+        return [cls.SEPARATOR.join(features) for features in slots]
+
+    @classmethod
+    def load(cls):
+        strings = cached_strings('distinguishing-features.csv', cls.parse)
+        return cls(s.split(cls.SEPARATOR) if s else () for s in strings)
+
+    def candidates(self, stat, value):
+        if stat in self.index and 0 <= value < self.VALUES:
+            return self.slots[self.index[stat] + value]
+        return self.EMPTY
+
+    def choice(self, stat, value, rng=random):
+        return rng.choice(self.candidates(stat, value))
+
+    def get(self, key, default=None):
+        # Lookup by (stat, value) as when this was a plain dict
+        features = self.candidates(*key)
+        return default if features is self.EMPTY else list(features)
+
+    def sample(self, stat, values, rng=None):
+        # One feature per entry of values, an integer array of one
+        # statistic across a batch (see generate_batch), with NumPy
+        numpy = optional_import('numpy')
+        if numpy is None:
+            raise ImportError('numpy is required for batch sampling')
+        if rng is None:
+            rng = numpy.random.default_rng()
+        values = numpy.asarray(values)
+        slots = self.index[stat] + numpy.clip(values, 0, self.VALUES - 1)
+        starts = numpy.frombuffer(self.starts, dtype=numpy.uint16)[slots]
+        counts = numpy.frombuffer(self.counts, dtype=numpy.uint16)[slots]
+        picks = starts + (rng.random(len(values)) * counts).astype(numpy.int64)
+        flat = numpy.array(self.flat + ('',), dtype=object)
+        out_of_range = (values < 0) | (values >= self.VALUES)
+        return flat[numpy.where(out_of_range, len(self.flat), picks)]
+
+
+class AliasTable(object):
+    # Walker's alias method: index i is drawn with probability weights[i] /
+    # sum(weights) in O(1).  Column i keeps a draw with probability prob[i]
+    # and hands it to alias[i] otherwise; a single random() gives both the
+    # column (integer part) and the coin (fraction).  Cached like
+    # StringTable, after a header with both source files' mtime and size.
+    MAGIC = b'DGGA\x01'
+    HEADER = struct.Struct('<5sqqqqI')
+
+    def __init__(self, prob, alias):
+        self.prob = prob
+        self.alias = alias
+        self.count = len(prob)
+
+    @classmethod
+    def build(cls, weights):
+        count = len(weights)
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError('weights must not all be zero')
+        scaled = [w * count / total for w in weights]
+        prob = array('d', [1.0]) * count
+        alias = array('I', range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding
+        return cls(prob, alias)
+
+    @classmethod
+    def read(cls, path, sources):
+        with open(path, 'rb') as f:
+            header = f.read(cls.HEADER.size)
+            magic, *stats, count = cls.HEADER.unpack(header)
+            if magic != cls.MAGIC or stats != cls.stats(sources):
+                raise ValueError('stale alias table: ' + path)
+            prob = array('d')
+            prob.fromfile(f, count)
+            alias = array('I')
+            alias.fromfile(f, count)
+        return cls(prob, alias)
+
+    def write(self, path, sources):
+        atomic_write(path, self.HEADER.pack(self.MAGIC, *self.stats(sources),
+                                            self.count) +
+                     self.prob.tobytes() + self.alias.tobytes())
+
+    @staticmethod
+    def stats(sources):
+        stats = []
+        for source in sources:
+            stat = os.stat(source)
+            stats += [stat.st_mtime_ns, stat.st_size]
+        return stats
+
+    def draw(self, rng=random):
+        u = rng.random() * self.count
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+
+def parse_weights(f, table):
+    # Weight per entry of table from a weights file, 0 for entries it
+    # leaves out; lines for entries the table lacks are ignored
+    index = {s: i for i, s in enumerate(table)}
+    weights = [0.0] * len(table)
+    for line in f:
+        entry, sep, weight = line.rstrip('\n').rpartition('\t')
+        if entry in index:
+            weights[index[entry]] = float(weight)
+    return weights
+
+
+def load_weights(name):
+    # AliasTable of a table's weights file, through the binary cache when
+    # it is usable; None when the table has no weights
+    source = data_path(WEIGHT_FILES[name]) if name in WEIGHT_FILES else None
+    if source is None or not os.path.exists(source):
+        return None
+    sources = (source, data_path(TABLE_FILES[name]))
+    if CACHE_DIR:
+        path = os.path.join(CACHE_DIR, WEIGHT_FILES[name] + '.bin')
+        try:
+            return AliasTable.read(path, sources)
+        except (OSError, ValueError, EOFError, struct.error):
+            pass
+    with open(source) as f:
+        sampler = AliasTable.build(parse_weights(f, load_table(name)))
+    if CACHE_DIR:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            sampler.write(path, sources)
+        except OSError:
+            pass
+    return sampler
+
+
+def picker(name):
+    # (table, AliasTable or None) of a table, loaded once per process
+    try:
+        return _PICKERS[name]
+    except KeyError:
+        pass
+    _PICKERS[name] = (load_table(name), load_weights(name))
+    return _PICKERS[name]
+
+
+def pick(name, rng=random):
+    # A random entry of a table, by its weights when it has a weights file
+    table, sampler = picker(name)
+    if sampler is None:
+        return rng.choice(table)
+    return table[sampler.draw(rng)]
+
+
+def load_table(name):
+    try:
+        return _TABLES[name]
+    except KeyError:
+        pass
+    if name == 'DISTINGUISHING':
+        table = FeatureTable.load()
+    else:
+        table = load_lines(TABLE_FILES[name])
+    _TABLES[name] = table
+    return table
+
+
+class SubsetFont(TTFont):
+    # A TTFont whose documents all start from the same subset, the one
+    # covering charset, instead of growing one as characters get drawn.
+    # The subset font program is then built once per process and, in
+    # FONT_SUBSET_DIR, once per font file rather than at every save.
+    # Characters outside charset still extend the subset as usual, and
+    # such subsets are simply built the old way.  Built on ReportLab
+    # internals (TTFont.State, the state per document, TTFontFace.makeSubset)
+    # as of the version pinned in reqirements.txt.
+    def __init__(self, name, filename, charset=FONT_CHARSET):
+        TTFont.__init__(self, name, filename)
+        self.filename = filename
+        self.subset_programs = {}
+        self.face.makeSubset = self.make_subset
+        self.template = self.fixed_state(charset)
+
+    def fixed_state(self, charset):
+        # The per-document state ReportLab ends up with after drawing
+        # charset, assigned through a throwaway document key
+        class Template(object):
+            pass
+        doc = Template()
+        TTFont.splitString(self, charset, doc)
+        return self.state.pop(doc)
+
+    def splitString(self, text, doc, encoding='utf-8'):
+        if doc not in self.state:
+            state = self.state[doc] = TTFont.State(self._asciiReadable, self)
+            state.assignments = dict(self.template.assignments)
+            state.subsets = [list(subset) for subset in self.template.subsets]
+            state.nextCode = self.template.nextCode
+        return TTFont.splitString(self, text, doc, encoding)
+
+    def subset_path(self, subset):
+        stat = os.stat(self.filename)
+        key = hashlib.sha1(repr((stat.st_mtime_ns, stat.st_size,
+                                 reportlab.Version, subset)).encode('ascii'))
+        return os.path.join(FONT_SUBSET_DIR, '%s-%s.ttf' % (
+            os.path.splitext(os.path.basename(self.filename))[0],
+            key.hexdigest()))
+
+    def make_subset(self, subset):
+        # TTFontFace.makeSubset through the in-process and on-disk caches
+        subset = tuple(subset)
+        program = self.subset_programs.get(subset)
+        if program is not None:
+            return program
+        if not CACHE_DIR:
+            program = type(self.face).makeSubset(self.face, list(subset))
+            self.subset_programs[subset] = program
+            return program
+        path = self.subset_path(subset)
+        try:
+            with open(path, 'rb') as f:
+                program = f.read()
+        except OSError:
+            program = type(self.face).makeSubset(self.face, list(subset))
+            try:
+                os.makedirs(FONT_SUBSET_DIR, exist_ok=True)
+                atomic_write(path, program)
+            except OSError:
+                pass
+        self.subset_programs[subset] = program
+        return program
+
+
+def register_fonts():
+    # Parse and register the TTF fonts once per process
+    if DEFAULT_FONT not in pdfmetrics.getRegisteredFontNames():
+        for name, filename in FONT_FILES.items():
+            pdfmetrics.registerFont(SubsetFont(name, data_path(filename)))
+
+
+_SHEET_XOBJECTS = []
+
+
+def sheet_xobjects():
+    # Both sides of the vector sheet as pdfrw form XObjects, parsed once
+    if not _SHEET_XOBJECTS:
+        if PdfReader is None:
+            raise ImportError('pdfrw is required for the vector background')
+        _SHEET_XOBJECTS.extend(pagexobj(page)
+                               for page in PdfReader(SHEET_PDF).pages)
+    return _SHEET_XOBJECTS
+
+
+_SHEET_DATA = []
+
+
+def sheet_data():
+    # The bytes of the vector sheet for PyPDF2, read once.  Each writer
+    # still parses its own copy: writing rewrites the references of the
+    # reader's objects in place, so one reader cannot serve two writers.
+    if not _SHEET_DATA:
+        with open(SHEET_PDF, 'rb') as f:
+            _SHEET_DATA.append(f.read())
+    return _SHEET_DATA[0]
+
+
+def release_sheet_xobjects(doc):
+    # makerl() remembers the ReportLab copy of every object it converts on
+    # the pdfrw object itself, keyed by document.  Drop doc's copies from
+    # the shared sheet once it is saved, or every canvas stays reachable.
+    seen = set()
+    stack = list(_SHEET_XOBJECTS)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        derived = getattr(obj, 'derived_rl_obj', None)
+        if derived:
+            derived.pop(doc, None)
+        if isinstance(obj, PdfDict):
+            stack.extend(obj.values())
+        elif isinstance(obj, PdfArray):
+            stack.extend(obj)
+
+
+def __getattr__(name):
+    if name in TABLE_FILES or name == 'DISTINGUISHING':
+        return load_table(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+# Location of form fields in Points (1/72 inch). 0,0 is bottom-left
+FIELD_XY = {
+    # Personal Data
+    'name': (75, 693),
+    'profession': (343, 693),
+    'nationality': (343, 665),
+    'age': (185, 640),
+    'birthday': (200, 640),
+    'male': (98, 639),
+    'female': (76, 639),
+
+    # Statistical Data
+    'strength': (136, 604),
+    'damage bonus': (555, 200),
+    'constitution': (136, 586),
+    'dexterity': (136, 568),
+    'intelligence': (136, 550),
+    'power': (136, 532),
+    'charisma': (136, 514),
+    'hitpoints': (195, 482),
+    'willpower': (195, 464),
+    'sanity': (195, 446),
+    'breaking point': (195, 428),
+    'bond1': (512, 604),
+    'bond2': (512, 586),
+    'bond3': (512, 568),
+    'bond4': (512, 550),
+
+    # Applicable Skill Sets
+    'accounting': (200, 361),
+    'alertness': (200, 343),
+    'anthropology': (200, 325),
+    'archeology': (200, 307),
+    'art1value': (200, 289),
+    'art2value': (200, 281),
+    'art3value': (200, 274),
+    'art1label': (90, 289),
+    'art2label': (90, 281),
+    'art3label': (90, 274),
+    'artillery': (200, 253),
+    'athletics': (200, 235),
+    'bureaucracy': (200, 217),
+    'computer science': (200, 200),
+    'craft1label': (90, 185),
+    'craft1value': (200, 185),
+    'craft2label': (90, 177),
+    'craft2value': (200, 177),
+    'craft3label': (90, 169),
+    'craft3value': (200, 169),
+    'craft4label': (90, 161),
+    'craft4value': (200, 161),
+    'criminology': (200, 145),
+    'demolitions': (200, 127),
+    'disguise': (200, 109),
+    'dodge': (200, 91),
+    'drive': (200, 73),
+    'firearms': (200, 54),
+    'first aide': (361, 361),
+    'forensics': (361, 343),
+    'heavy machinery': (361, 325),
+    'heavy weapons': (361, 307),
+    'history': (361, 289),
+    'humint': (361, 270),
+    'law': (361, 253),
+    'medicine': (361, 235),
+    'melee weapons': (361, 217),
+    'military science': (361, 199),
+    'milsci label': (327, 199),
+    'navigate': (361, 163),
+    'occult': (361, 145),
+    'persuade': (361, 127),
+    'pharmacy': (361, 109),
+    'pilot1': (361, 91),
+    'pilot2': (361, 83),
+    'psychotherapy': (361, 54),
+    'ride': (521, 361),
+    'science1label': (442, 347),
+    'science1value': (521, 347),
+    'science2label': (442, 340),
+    'science2value': (521, 340),
+    'science3label': (442, 333),
+    'science3value': (521, 333),
+    'science4label': (442, 326),
+    'science4value': (521, 326),
+    'search': (521, 307),
+    'sigint': (521, 289),
+    'stealth': (521, 270),
+    'surgery': (521, 253),
+    'survival': (521, 235),
+    'swim': (521, 217),
+    'unarmed combat': (521, 200),
+    'unnatural': (521, 181),
+    'language1': (521, 145),
+    'language2': (521, 127),
+    'language3': (521, 109),
+    'skill1': (521, 91),
+    'skill2': (521, 73),
+    'skill3': (521, 54),
+}
+
+# Numeric sheet fields and their slot in a CharacterRecord
+NUMERIC_FIELDS = tuple(f for f in FIELD_XY if not is_text_field(f))
+FIELD_INDEX = {f: n for n, f in enumerate(NUMERIC_FIELDS)}
+# Marks a numeric field the agent doesn't have
+MISSING = -32768
+_BLANK_VALUES = array('h', [MISSING]) * len(NUMERIC_FIELDS)
+_MISSING_ALL = (MISSING,) * len(NUMERIC_FIELDS)
+
+
+class CharacterRecord(MutableMapping):
+    # Compact stand-in for a character dictionary: numeric fields in a
+    # typed array indexed by FIELD_INDEX, text and labels in a small dict.
+    # Behaves like the dict it replaces, iterating text fields first.
+    __slots__ = ('values', 'text')
+
+    def __init__(self, d=()):
+        self.values = array('h', _BLANK_VALUES)
+        self.text = {}
+        for key, value in dict(d).items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, d):
+        record = cls.__new__(cls)
+        record.values = array('h', map(d.get, NUMERIC_FIELDS, _MISSING_ALL))
+        record.text = {key: value for key, value in d.items()
+                       if key not in FIELD_INDEX}
+        return record
+
+    def __getitem__(self, key):
+        n = FIELD_INDEX.get(key)
+        if n is None:
+            return self.text[key]
+        value = self.values[n]
+        if value == MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        n = FIELD_INDEX.get(key)
+        if n is None:
+            self.text[key] = value
+        else:
+            self.values[n] = value
+
+    def __delitem__(self, key):
+        n = FIELD_INDEX.get(key)
+        if n is None:
+            del self.text[key]
+        elif self.values[n] == MISSING:
+            raise KeyError(key)
+        else:
+            self.values[n] = MISSING
+
+    def __iter__(self):
+        for key in self.text:
+            yield key
+        for n, value in enumerate(self.values):
+            if value != MISSING:
+                yield NUMERIC_FIELDS[n]
+
+    def __len__(self):
+        return len(self.text) + len(self.values) - self.values.count(MISSING)
+
+    def __contains__(self, key):
+        n = FIELD_INDEX.get(key)
+        if n is None:
+            return key in self.text
+        return self.values[n] != MISSING
+
+    def items(self):
+        # Faster than the generic Mapping view for the render loop
+        for item in self.text.items():
+            yield item
+        for n, value in enumerate(self.values):
+            if value != MISSING:
+                yield NUMERIC_FIELDS[n], value
+
+    def __repr__(self):
+        return 'CharacterRecord(%r)' % dict(self.items())
+
+
+# Skills every agent starts with before profession and bonus package
+DEFAULT_SKILLS = {
+    'accounting': 10,
+    'alertness': 20,
+    'athletics': 30,
+    'bureaucracy': 10,
+    'criminology': 10,
+    'disguise': 10,
+    'dodge': 30,
+    'drive': 20,
+    'firearms': 20,
+    'first aide': 10,
+    'heavy machinery': 10,
+    'history': 10,
+    'humint': 10,
+    'melee weapons': 30,
+    'navigate': 10,
+    'occult': 10,
+    'persuade': 20,
+    'psychotherapy': 10,
+    'ride': 10,
+    'search': 20,
+    'stealth': 10,
+    'survival': 10,
+    'swim': 20,
+    'unarmed combat': 40,
+}
+
+# Profession templates.  'skills' are always set, 'picks' of the 'choices'
+# are sampled per agent and 'bonds' bonds start at the agent's charisma.
+# Keys are tuples of the professions sharing a template.
+_PROFESSIONS = {
+    ('Anthropologist',): {
+        'skills': {
+            'anthropology': 50,
+            'bureaucracy': 40,
+            'language1': 50,
+            'language2': 30,
+            'history': 60,
+            'occult': 40,
+            'persuade': 40,
+        },
+        'choices': (
+            ('archeology', 40),
+            ('humint', 50),
+            ('navigate', 50),
+            ('ride', 50),
+            ('search', 60),
+            ('survival', 50),
+        ),
+        'picks': 2,
+        'bonds': 4,
+    },
+    ('Historian',): {
+        'skills': {
+            'archeology': 50,
+            'bureaucracy': 40,
+            'language1': 50,
+            'language2': 30,
+            'history': 60,
+            'occult': 40,
+            'persuade': 40,
+        },
+        'choices': (
+            ('anthropology', 40),
+            ('humint', 50),
+            ('navigate', 50),
+            ('ride', 50),
+            ('search', 60),
+            ('survival', 50),
+        ),
+        'picks': 2,
+        'bonds': 4,
+    },
+    ('Computer Science', 'Engineer'): {
+        'skills': {
+            'computer science': 60,
+            'craft1label': 'Electrician',
+            'craft1value': 30,
+            'craft2label': 'Mechanic',
+            'craft2value': 30,
+            'craft3label': 'Microelectronics',
+            'craft3value': 40,
+            'science1label': 'Mathematics',
+            'science1value': 40,
+            'sigint': 40,
+        },
+        'choices': (
+            ('accounting', 50),
+            ('bureaucracy', 50),
+            ('craft4value', 40),
+            ('language1', 40),
+            ('heavy machinery', 50),
+            ('law', 40),
+            ('science3value', 40),
+        ),
+        'picks': 4,
+        'bonds': 3,
+    },
+    ('Criminal',): {
+        'skills': {
+            'alertness': 50,
+            'criminology': 60,
+            'dodge': 40,
+            'drive': 50,
+            'firearms': 40,
+            'law': 40,
+            'melee weapons': 40,
+            'persuade': 50,
+            'stealth': 50,
+            'unarmed combat': 50,
+            'craft1label': 'Locksmithing',
+        },
+        'choices': (
+            ('craft1value', 40),
+            ('demolitions', 40),
+            ('disguise', 50),
+            ('language1', 40),
+            ('humint', 50),
+            ('navigate', 50),
+            ('occult', 50),
+            ('pharmacy', 40),
+        ),
+        'picks': 2,
+        'bonds': 4,
+    },
+    ('Federal Agent',): {
+        'skills': {
+            'alertness': 50,
+            'bureaucracy': 40,
+            'criminology': 50,
+            'drive': 50,
+            'firearms': 50,
+            'forensics': 30,
+            'humint': 60,
+            'law': 30,
+            'persuade': 50,
+            'search': 50,
+            'unarmed combat': 60,
+        },
+        'choices': (
+            ('accounting', 60),
+            ('computer science', 50),
+            ('language1', 50),
+            ('heavy weapons', 50),
+            ('pharmacy', 50),
+        ),
+        'picks': 1,
+        'bonds': 3,
+    },
+    ('Firefighter',): {
+        'skills': {
+            'alertness': 50,
+            'athletics': 60,
+            'craft1label': 'Electrician',
+            'craft1value': 40,
+            'craft2label': 'Mechanic',
+            'craft2value': 40,
+            'demolitions': 50,
+            'drive': 50,
+            'first aide': 50,
+            'forensics': 40,
+            'heavy machinery': 50,
+            'navigate': 50,
+            'search': 40,
+        },
+        'bonds': 3,
+    },
+    ('Foreign Service Officer',): {
+        'skills': {
+            'accounting': 40,
+            'anthropology': 40,
+            'bureaucracy': 60,
+            'language1': 50,
+            'language2': 50,
+            'language3': 40,
+            'history': 40,
+            'humint': 50,
+            'law': 40,
+            'persuade': 50,
+        },
+        'bonds': 3,
+    },
+    ('Intelligence Analyst',): {
+        'skills': {
+            'anthropology': 40,
+            'bureaucracy': 50,
+            'computer science': 40,
+            'criminology': 40,
+            'language1': 50,
+            'language2': 50,
+            'language3': 40,
+            'history': 40,
+            'humint': 50,
+            'sigint': 40,
+        },
+        'bonds': 3,
+    },
+    ('Intelligence Case Officer',): {
+        'skills': {
+            'alertness': 50,
+            'bureaucracy': 40,
+            'criminology': 50,
+            'disguise': 50,
+            'drive': 40,
+            'firearms': 40,
+            'language1': 50,
+            'language2': 40,
+            'humint': 60,
+            'sigint': 40,
+            'stealth': 50,
+            'unarmed combat': 50,
+        },
+        'bonds': 2,
+    },
+    ('Lawyer', 'Business Executive'): {
+        'skills': {
+            'accounting': 50,
+            'bureaucracy': 50,
+            'humint': 40,
+            'persuade': 60,
+        },
+        'choices': (
+            ('computer science', 50),
+            ('criminology', 60),
+            ('language1', 50),
+            ('law', 50),
+            ('pharmacy', 50),
+        ),
+        'picks': 4,
+        'bonds': 4,
+    },
+    ('Media Specialist',): {
+        'skills': {
+            'art1value': 60,
+            'history': 40,
+            'humint': 40,
+            'persuade': 50,
+        },
+        'choices': (
+            ('anthropology', 40),
+            ('archeology', 40),
+            ('art2value', 40),
+            ('bureaucracy', 50),
+            ('computer science', 40),
+            ('criminology', 50),
+            ('language1', 40),
+            ('law', 40),
+            ('military science', 40),
+            ('occult', 50),
+            ('science1value', 40),
+        ),
+        'picks': 5,
+        'bonds': 4,
+    },
+    ('Nurse', 'Paramedic'): {
+        'skills': {
+            'alertness': 40,
+            'bureaucracy': 40,
+            'first aide': 60,
+            'humint': 40,
+            'medicine': 40,
+            'persuade': 40,
+            'pharmacy': 40,
+            'science1label': 'Biology',
+            'science1value': 40,
+        },
+        'choices': (
+            ('drive', 60),
+            ('forensics', 40),
+            ('navigate', 50),
+            ('psychotherapy', 50),
+            ('search', 60),
+        ),
+        'picks': 2,
+        'bonds': 4,
+    },
+    ('Physician',): {
+        'skills': {
+            'bureaucracy': 50,
+            'first aide': 60,
+            'medicine': 60,
+            'persuade': 40,
+            'pharmacy': 50,
+            'science1label': 'Biology',
+            'science1value': 60,
+            'search': 40,
+        },
+        'choices': (
+            ('forensics', 50),
+            ('psychotherapy', 60),
+            ('science2value', 50),
+            ('surgery', 50),
+        ),
+        'picks': 2,
+        'bonds': 3,
+    },
+    ('Pilot', 'Sailor'): {
+        'skills': {
+            'alertness': 60,
+            'bureaucracy': 30,
+            'craft1label': 'Electrician',
+            'craft1value': 40,
+            'craft2label': 'Mechanic',
+            'craft2value': 40,
+            'navigate': 50,
+            'pilot1': 60,
+            'science1label': 'Meteorology',
+            'science1value': 40,
+            'swim': 40,
+        },
+        'choices': (
+            ('language1', 50),
+            ('pilot2', 50),
+            ('heavy weapons', 50),
+            ('military science', 50),
+        ),
+        'picks': 2,
+        'bonds': 3,
+    },
+    ('Police Officer',): {
+        'skills': {
+            'alertness': 60,
+            'bureaucracy': 40,
+            'criminology': 50,
+            'drive': 50,
+            'firearms': 40,
+            'first aide': 30,
+            'humint': 50,
+            'law': 30,
+            'melee weapons': 50,
+            'navigate': 40,
+            'persuade': 40,
+            'search': 50,
+            'unarmed combat': 60,
+        },
+        'choices': (
+            ('forensics', 50),
+            ('heavy machinery', 60),
+            ('heavy weapons', 50),
+            ('ride', 60),
+        ),
+        'picks': 1,
+        'bonds': 3,
+    },
+    ('Program Manager',): {
+        'skills': {
+            'accounting': 60,
+            'bureaucracy': 60,
+            'computer science': 50,
+            'criminology': 30,
+            'language1': 50,
+            'history': 40,
+            'law': 40,
+            'persuade': 50,
+        },
+        'choices': (
+            ('anthropology', 30),
+            ('art1value', 30),
+            ('craft1value', 30),
+            ('science1value', 30),
+        ),
+        'picks': 1,
+        'bonds': 4,
+    },
+    ('Scientist',): {
+        'skills': {
+            'bureaucracy': 40,
+            'computer science': 40,
+            'science1value': 60,
+            'science2value': 50,
+            'science3value': 50,
+        },
+        'choices': (
+            ('accounting', 50),
+            ('craft1value', 40),
+            ('language1', 40),
+            ('forensics', 40),
+            ('law', 40),
+            ('pharmacy', 40),
+        ),
+        'picks': 3,
+        'bonds': 4,
+    },
+    ('Soldier', 'Marine'): {
+        'skills': {
+            'alertness': 50,
+            'athletics': 50,
+            'bureaucracy': 30,
+            'drive': 40,
+            'firearms': 40,
+            'first aide': 40,
+            'military science': 40,
+            'milsci label': 'Land',
+            'navigate': 40,
+            'persuade': 30,
+            'unarmed combat': 50,
+        },
+        'choices': (
+            ('artillery', 40),
+            ('computer science', 40),
+            ('demolitions', 40),
+            ('language1', 40),
+            ('heavy machinery', 50),
+            ('heavy weapons', 40),
+            ('search', 60),
+            ('sigint', 40),
+            ('swim', 60),
+        ),
+        'picks': 3,
+        'bonds': 4,
+    },
+    ('Special Operator',): {
+        'skills': {
+            'alertness': 60,
+            'athletics': 60,
+            'demolitions': 40,
+            'firearms': 60,
+            'heavy weapons': 50,
+            'melee weapons': 50,
+            'military science': 60,
+            'navigate': 50,
+            'stealth': 50,
+            'survival': 50,
+            'swim': 50,
+            'unarmed combat': 60,
+        },
+        'bonds': 2,
+    },
+}
+
+# Skills a bonus package may spend a free pick on
+POSSIBLE_BONUS_SKILLS = (
+    'accounting',
+    'alertness',
+    'anthropology',
+    'archeology',
+    'art1value',
+    'artillery',
+    'athletics',
+    'bureaucracy',
+    'computer science',
+    'craft1value',
+    'criminology',
+    'demolitions',
+    'disguise',
+    'dodge',
+    'drive',
+    'firearms',
+    'first aide',
+    'forensics',
+    'heavy machinery',
+    'heavy weapons',
+    'history',
+    'humint',
+    'law',
+    'medicine',
+    'melee weapons',
+    'military science',
+    'navigate',
+    'occult',
+    'persuade',
+    'pharmacy',
+    'pilot1',
+    'psychotherapy',
+    'ride',
+    'science1value',
+    'search',
+    'sigint',
+    'stealth',
+    'surgery',
+    'survival',
+    'swim',
+    'unarmed combat',
+    'language1',
+)
+
+# Bonus packages.  'labels' are (prefix, label) pairs claimed through
+# setLabelSkill, 'skills' are always boosted and 'picks' is a sequence of
+# (pool, count) draws where a pool of None means any remaining skill from
+# POSSIBLE_BONUS_SKILLS.  Keys are tuples of the names a package answers to.
+_BONUS_PACKAGES = {
+    ('artist', 'actor', 'musician'): {
+        'skills': (
+            'alertness',
+            'craft1value',
+            'disguise',
+            'persuade',
+            'art1value',
+            'art2value',
+            'art3value',
+            'humint',
+        ),
+    },
+    ('athlete',): {
+        'skills': (
+            'alertness',
+            'athletics',
+            'dodge',
+            'first aide',
+            'humint',
+            'persuade',
+            'swim',
+            'unarmed combat',
+        ),
+    },
+    ('author', 'editor', 'journalist'): {
+        'skills': (
+            'anthropology',
+            'art1value',
+            'bureaucracy',
+            'history',
+            'law',
+            'occult',
+            'persuade',
+            'humint',
+        ),
+    },
+    ('black bag training', 'blackbag'): {
+        'labels': (('craft', 'Electrician'), ('craft', 'Locksmithing')),
+        'skills': (
+            'alertness',
+            'athletics',
+            'criminology',
+            'disguise',
+            'search',
+            'stealth',
+        ),
+    },
+    ('blue-collar worker', 'bluecollar'): {
+        'skills': (
+            'alertness',
+            'craft1value',
+            'craft2value',
+            'drive',
+            'first aide',
+            'heavy machinery',
+            'navigate',
+            'search',
+        ),
+    },
+    ('bureaucrat',): {
+        'skills': (
+            'accounting',
+            'bureaucracy',
+            'computer science',
+            'criminology',
+            'humint',
+            'law',
+            'persuade',
+        ),
+        'picks': ((None, 1),),
+    },
+    ('clergy',): {
+        'skills': (
+            'language1',
+            'language2',
+            'language3',
+            'history',
+            'humint',
+            'occult',
+            'persuade',
+            'psychotherapy',
+        ),
+    },
+    ('combat veteran', 'veteran'): {
+        'skills': (
+            'alertness',
+            'dodge',
+            'firearms',
+            'first aide',
+            'heavy weapons',
+            'melee weapons',
+            'stealth',
+            'unarmed combat',
+        ),
+    },
+    ('computer enthusiast', 'hacker'): {
+        'labels': (('craft', 'Microelectronics'), ('science', 'Mathematics')),
+        'skills': (
+            'computer science',
+            'sigint',
+        ),
+        'picks': ((None, 4),),
+    },
+    ('counselor',): {
+        'skills': (
+            'bureaucracy',
+            'first aide',
+            'language1',
+            'humint',
+            'law',
+            'persuade',
+            'psychotherapy',
+            'search',
+        ),
+    },
+    ('criminalist',): {
+        'skills': (
+            'accounting',
+            'bureaucracy',
+            'computer science',
+            'criminology',
+            'forensics',
+            'law',
+            'pharmacy',
+            'search',
+        ),
+    },
+    ('firefighter',): {
+        'skills': (
+            'alertness',
+            'demolitions',
+            'drive',
+            'first aide',
+            'forensics',
+            'heavy machinery',
+            'navigate',
+            'search',
+        ),
+    },
+    ('gangster', 'deep cover'): {
+        'skills': (
+            'alertness',
+            'criminology',
+            'dodge',
+            'drive',
+            'persuade',
+            'stealth',
+        ),
+        'picks': (
+            (('athletics',
+              'language1',
+              'firearms',
+              'humint',
+              'melee weapons',
+              'pharmacy',
+              'unarmed combat'), 2),
+        ),
+    },
+    ('interrogator',): {
+        'skills': (
+            'criminology',
+            'language1',
+            'language2',
+            'humint',
+            'law',
+            'persuade',
+            'pharmacy',
+            'search',
+        ),
+    },
+    ('liberal arts degree', 'arts'): {
+        'skills': (
+            'art1value',
+            'language1',
+            'history',
+            'persuade',
+        ),
+        'picks': (
+            (('anthropology', 'archeology'), 1),
+            (None, 3),
+        ),
+    },
+    ('military officer', 'military'): {
+        'skills': (
+            'bureaucracy',
+            'firearms',
+            'history',
+            'military science',
+            'navigate',
+            'persuade',
+            'unarmed combat',
+        ),
+        'picks': (
+            (('artillery',
+              'heavy machinery',
+              'heavy weapons',
+              'humint',
+              'pilot1',
+              'sigint'), 1),
+        ),
+    },
+    ('mba',): {
+        'skills': (
+            'accounting',
+            'bureaucracy',
+            'humint',
+            'law',
+            'persuade',
+        ),
+        'picks': ((None, 3),),
+    },
+    ('nurse', 'paramedic', 'premed', 'pre-med'): {
+        'labels': (('science', 'Biology'),),
+        'skills': (
+            'alertness',
+            'first aide',
+            'medicine',
+            'persuade',
+            'pharmacy',
+            'psychotherapy',
+            'search',
+        ),
+    },
+    ('occult investigator', 'occult', 'conspiracy theorist', 'conspiracy'): {
+        'skills': (
+            'anthropology',
+            'archeology',
+            'computer science',
+            'criminology',
+            'history',
+            'occult',
+            'persuade',
+            'search',
+        ),
+    },
+    ('outdoorsman',): {
+        'skills': (
+            'alertness',
+            'athletics',
+            'firearms',
+            'navigate',
+            'ride',
+            'search',
+            'stealth',
+            'survival',
+        ),
+    },
+    ('photographer',): {
+        'labels': (('art', 'Photography'),),
+        'skills': (
+            'alertness',
+            'computer science',
+            'persuade',
+            'search',
+            'stealth',
+        ),
+        'picks': ((None, 2),),
+    },
+    ('pilot', 'sailor'): {
+        'labels': (('craft', 'Mechanic'),),
+        'skills': (
+            'alertness',
+            'first aide',
+            'language1',
+            'navigate',
+            'pilot1',
+            'survival',
+            'swim',
+        ),
+    },
+    ('police officer', 'police'): {
+        'skills': (
+            'alertness',
+            'criminology',
+            'drive',
+            'firearms',
+            'humint',
+            'law',
+            'melee weapons',
+            'unarmed combat',
+        ),
+    },
+    ('science grad student', 'science'): {
+        'skills': (
+            'bureaucracy',
+            'computer science',
+            'craft1value',
+            'language1',
+            'science1value',
+            'science2value',
+            'science3value',
+        ),
+        'picks': (
+            (('accounting',
+              'forensics',
+              'law',
+              'pharmacy'), 1),
+        ),
+    },
+    ('social worker', 'social', 'criminal justice degree'): {
+        'skills': (
+            'bureaucracy',
+            'criminology',
+            'forensics',
+            'language1',
+            'humint',
+            'law',
+            'persuade',
+            'search',
+        ),
+    },
+    ('soldier', 'marine'): {
+        'skills': (
+            'alertness',
+            'artillery',
+            'athletics',
+            'drive',
+            'firearms',
+            'heavy weapons',
+            'military science',
+            'unarmed combat',
+        ),
+    },
+    ('translator',): {
+        'skills': (
+            'anthropology',
+            'language1',
+            'language2',
+            'language3',
+            'history',
+            'humint',
+            'persuade',
+        ),
+        'picks': ((None, 1),),
+    },
+    ('urban explorer',): {
+        'skills': (
+            'alertness',
+            'athletics',
+            'craft1value',
+            'law',
+            'navigate',
+            'persuade',
+            'search',
+            'stealth',
+        ),
+    },
+    ('random',): {
+        'picks': ((None, 8),),
+    },
+}
+
+
+def _compile_profession(template):
+    # Freeze a profession template into (skills, choices, picks, bond keys)
+    return (
+        dict(template['skills']),
+        tuple(template.get('choices', ())),
+        template.get('picks', 0),
+        tuple('bond%d' % n for n in range(1, template['bonds'] + 1)),
+    )
+
 
-with open('data/girls1986.txt') as f:
-    FEMALES = f.read().splitlines()
+def _compile_bonus_package(package):
+    # Freeze a bonus package into (labels, skills, picks)
+    return (
+        tuple(package.get('labels', ())),
+        frozenset(package.get('skills', ())),
+        tuple((pool if pool is None else tuple(pool), count)
+              for pool, count in package.get('picks', ())),
+    )
 
-with open('data/surnames.txt') as f:
-    SURNAMES = f.read().splitlines()
 
-with open('data/towns.txt') as f:
-    TOWNS = f.read().splitlines()
+# Compiled registries, keyed by every name a template answers to
+PROFESSION_REGISTRY = {
+    name: _compile_profession(template)
+    for names, template in _PROFESSIONS.items() for name in names
+}
+
+BONUS_REGISTRY = {
+    name: _compile_bonus_package(package)
+    for names, package in _BONUS_PACKAGES.items() for name in names
+}
+
+# One name per bonus package, the first it answers to
+BONUS_PACKAGES = tuple(names[0] for names in _BONUS_PACKAGES)
+
+
+def agent_seed(seed, profession, index):
+    # Seed of agent #index of a profession.  Each agent draws from its own
+    # stream, so it comes out the same however the run is split across
+    # workers or files, and whatever else is on the roster.
+    if seed is None:
+        return None
+    return '%s/%s/%d' % (seed, profession, index)
+
+
+class UniqueNames(object):
+    # Agent names without repeats.  Each agent has a slot from its
+    # profession and its index within it (the numbering agent_seed uses),
+    # and a keyed pseudo-random permutation maps the slot to one of the
+    # surname x given name pairs of its gender.  No two slots share a pair,
+    # and naming an agent is O(1) and needs nothing but the key, so shards
+    # and chunks rendered anywhere agree.  Given names on both the male and
+    # female lists take even surnames for men and odd ones for women.
+    ROUNDS = 4
+
+    def __init__(self, key=None):
+        if key is None:
+            key = os.urandom(16).hex()
+        self.key = key
+        self.secret = hashlib.sha256(str(key).encode('utf-8')).digest()
+        self.spaces = {}
+        self.rounds = {}
+
+    def __getstate__(self):
+        # Workers rebuild the name spaces from their own tables
+        return {'key': self.key}
+
+    def __setstate__(self, state):
+        self.__init__(state['key'])
+
+    def space(self, gender):
+        # (surnames, given names of this gender only, shared given names,
+        # surnames per shared given name, size)
+        try:
+            return self.spaces[gender]
+        except KeyError:
+            pass
+        surnames = [s.upper() for s in load_table('SURNAMES') if s]
+        mine, other = ('MALES', 'FEMALES') if gender == 'male' else \
+            ('FEMALES', 'MALES')
+        other = set(load_table(other))
+        given = [g for g in dict.fromkeys(load_table(mine)) if g]
+        own = [g for g in given if g not in other]
+        shared = [g for g in given if g in other]
+        half = (len(surnames) + (gender == 'male')) // 2
+        space = (surnames, own, shared, half,
+                 len(surnames) * len(own) + half * len(shared))
+        self.spaces[gender] = space
+        return space
+
+    def capacity(self, gender):
+        # Agents of this gender per profession that are sure to be named
+        return self.space(gender)[-1] // len(PROFESSIONS)
+
+    def permute(self, slot, size, gender):
+        # Feistel network over a x b >= size with a and b about sqrt(size),
+        # each round adding a keyed random function of one side, a table of
+        # b entries, to the other modulo a; cycle walking until the result
+        # falls below size
+        a = math.isqrt(size - 1) + 1
+        b = -(-size // a)
+        rounds = self.rounds.get((gender, size))
+        if rounds is None:
+            rng = random.Random(self.secret + gender.encode())
+            rounds = self.rounds[gender, size] = [
+                [rng.getrandbits(32) for x in range(b)]
+                for r in range(self.ROUNDS)]
+        x = slot
+        while True:
+            for table in rounds:
+                left, right = divmod(x, b)
+                x = a * right + (left + table[right]) % a
+            if x < size:
+                return x
+
+    def name(self, profession, gender, index):
+        surnames, own, shared, half, size = self.space(gender)
+        slot = index * len(PROFESSIONS) + PROFESSIONS.index(profession)
+        if slot >= size:
+            raise ValueError('no unique name left for %s #%d' % (profession,
+                                                                 index))
+        x = self.permute(slot, size, gender)
+        if x < len(surnames) * len(own):
+            surname, given = surnames[x % len(surnames)], own[x // len(surnames)]
+        else:
+            x -= len(surnames) * len(own)
+            surname = surnames[2 * (x % half) + (gender != 'male')]
+            given = shared[x // half]
+        return surname + ', ' + given
+
+
+def claim_label(d, prefix, label):
+    # Find or take the first free labelled slot (craft1, craft2, ...) in d
+    for n in range(1,4):
+        key = prefix + str(n) + 'label'
+        value = prefix + str(n) + 'value'
+        if key not in d:
+            d[key] = label
+            return key, value
+        elif d[key] == label:
+            return key, value
+
+    return None, None
 
-DISTINGUISHING = {}
-with open('data/distinguishing-features.csv') as distinguishing:
-    for row in csv.DictReader(distinguishing):
-        for value in range(int(row['from']), int(row['to']) + 1):
-            DISTINGUISHING.setdefault(
-                (row['statistic'], value), []).append(row['distinguishing'])
 
 class Need2KnowCharacter(object):
+    __slots__ = ('d', 'bonus_skills', 'seed')
 
     statpools = (
         [13, 13, 12, 12, 11, 11],
@@ -70,26 +1738,36 @@ class Need2KnowCharacter(object):
         [17, 14, 13, 10, 10, 8],
     )
 
-    def __init__(self, gender='male', profession='', bonus_package=''):
+    def __init__(self, gender='male', profession='', bonus_package='',
+                 seed=None, name=None):
 
         # Hold all dictionary
         self.d = {}
-        self.bonus_skills = []
-        
+        self.bonus_skills = set()
+        # Without a seed draw from the shared global generator
+        self.seed = seed
+        rng = random if seed is None else random.Random(seed)
+
         if gender == 'male':
             self.d['male'] = 'X'
-            self.d['name'] = choice(SURNAMES).upper() + ', ' + choice(MALES)
+            self.d['name'] = (pick('SURNAMES', rng).upper() + ', ' +
+                              pick('MALES', rng))
         else:
             self.d['female'] = 'X'
-            self.d['name'] = choice(SURNAMES).upper() + ', ' + choice(FEMALES)
+            self.d['name'] = (pick('SURNAMES', rng).upper() + ', ' +
+                              pick('FEMALES', rng))
+        # A given name (see UniqueNames) replaces the drawn one, which still
+        # takes its draws so the rest of the agent comes out the same
+        if name is not None:
+            self.d['name'] = name
         self.d['profession'] = profession
-        self.d['nationality'] = '(U.S.A.) ' + choice(TOWNS)
-        self.d['age'] = '%d    (%s %d)' % (randint(24, 55), choice(MONTHS),
-            (randint(1, 28)))
+        self.d['nationality'] = '(U.S.A.) ' + pick('TOWNS', rng)
+        self.d['age'] = '%d    (%s %d)' % (rng.randint(24, 55), rng.choice(MONTHS),
+            (rng.randint(1, 28)))
 
         # Spend the Point Pool
-        pool = choice(self.statpools)
-        shuffle(pool)
+        pool = list(rng.choice(self.statpools))
+        rng.shuffle(pool)
         self.d['strength'] = pool[0]
         self.d['constitution'] = pool[1]
         self.d['dexterity'] = pool[2]
@@ -105,907 +1783,35 @@ class Need2KnowCharacter(object):
         self.d['breaking point'] = self.d['power'] * 4
         self.d['damage bonus'] = 'DB=%d' % (((self.d['strength'] - 1) >> 2 ) - 2)
         # Default Skills
-        self.d['accounting'] = 10
-        self.d['alertness'] = 20
-        self.d['athletics'] = 30
-        self.d['bureaucracy'] = 10
-        self.d['criminology'] = 10
-        self.d['disguise'] = 10
-        self.d['dodge'] = 30
-        self.d['drive'] = 20
-        self.d['firearms'] = 20
-        self.d['first aide'] = 10
-        self.d['heavy machinery'] = 10
-        self.d['history'] = 10
-        self.d['humint'] = 10
-        self.d['melee weapons'] = 30
-        self.d['navigate'] = 10
-        self.d['occult'] = 10
-        self.d['persuade'] = 20
-        self.d['psychotherapy'] = 10
-        self.d['ride'] = 10
-        self.d['search'] = 20
-        self.d['stealth'] = 10
-        self.d['survival'] = 10
-        self.d['swim'] = 20
-        self.d['unarmed combat'] = 40
-
-        if profession == 'Anthropologist':
-
-            self.d['anthropology'] = 50
-            self.d['bureaucracy'] = 40
-            self.d['language1'] = 50
-            self.d['language2'] = 30
-            self.d['history'] = 60
-            self.d['occult'] = 40
-            self.d['persuade'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('archeology', 40),
-                ('humint', 50),
-                ('navigate', 50),
-                ('ride', 50),
-                ('search', 60),
-                ('survival', 50),
-            ])
-            choice1, choice2 = sample(possible, 2)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-
-        if profession == 'Historian':
-
-            self.d['archeology'] = 50
-            self.d['bureaucracy'] = 40
-            self.d['language1'] = 50
-            self.d['language2'] = 30
-            self.d['history'] = 60
-            self.d['occult'] = 40
-            self.d['persuade'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('anthropology', 40),
-                ('humint', 50),
-                ('navigate', 50),
-                ('ride', 50),
-                ('search', 60),
-                ('survival', 50),
-            ])
-            choice1, choice2 = sample(possible, 2)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-
-        if profession == 'Computer Science' or profession == 'Engineer':
-
-            self.d['computer science'] = 60
-            self.d['craft1label'] = 'Electrician'
-            self.d['craft1value'] = 30
-            self.d['craft2label'] = 'Mechanic'
-            self.d['craft2value'] = 30
-            self.d['craft3label'] = 'Microelectronics'
-            self.d['craft3value'] = 40
-            self.d['science1label'] = 'Mathematics'
-            self.d['science1value'] = 40
-            self.d['sigint'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            possible = set([
-                ('accounting', 50),
-                ('bureaucracy', 50),
-                ('craft4value', 40),
-                ('language1', 40),
-                ('heavy machinery', 50),
-                ('law', 40),
-                ('science3value', 40),
-            ])
-            choice1, choice2, choice3, choice4 = sample(possible, 4)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-            self.d[choice3[0]] = choice3[1]
-            self.d[choice4[0]] = choice4[1]
-
-        if profession == 'Criminal':
-
-            self.d['alertness'] = 50
-            self.d['criminology'] = 60
-            self.d['dodge'] = 40
-            self.d['drive'] = 50
-            self.d['firearms'] = 40
-            self.d['law'] = 40
-            self.d['melee weapons'] = 40
-            self.d['persuade'] = 50
-            self.d['stealth'] = 50
-            self.d['unarmed combat'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            self.d['craft1label'] = 'Locksmithing'
-            possible = set([
-                ('craft1value', 40),
-                ('demolitions', 40),
-                ('disguise', 50),
-                ('language1', 40),
-                ('humint', 50),
-                ('navigate', 50),
-                ('occult', 50),
-                ('pharmacy', 40),
-            ])
-            choice1, choice2 = sample(possible, 2)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-
-        if profession == 'Federal Agent':
-
-            self.d['alertness'] = 50
-            self.d['bureaucracy'] = 40
-            self.d['criminology'] = 50
-            self.d['drive'] = 50
-            self.d['firearms'] = 50
-            self.d['forensics'] = 30
-            self.d['humint'] = 60
-            self.d['law'] = 30
-            self.d['persuade'] = 50
-            self.d['search'] = 50
-            self.d['unarmed combat'] = 60
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            possible = set([
-                ('accounting', 60),
-                ('computer science', 50),
-                ('language1', 50),
-                ('heavy weapons', 50),
-                ('pharmacy', 50),
-            ])
-            choice1 = sample(possible, 1)[0]
-            self.d[choice1[0]] = choice1[1]
-
-        if profession == 'Firefighter':
-
-            self.d['alertness'] = 50
-            self.d['athletics'] = 60
-            self.d['craft1label'] = 'Electrician'
-            self.d['craft1value'] = 40
-            self.d['craft2label'] = 'Mechanic'
-            self.d['craft2value'] = 40
-            self.d['demolitions'] = 50
-            self.d['drive'] = 50
-            self.d['first aide'] = 50
-            self.d['forensics'] = 40
-            self.d['heavy machinery'] = 50
-            self.d['navigate'] = 50
-            self.d['search'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-
-        if profession == 'Foreign Service Officer':
-
-            self.d['accounting'] = 40
-            self.d['anthropology'] = 40
-            self.d['bureaucracy'] = 60
-            self.d['language1'] = 50
-            self.d['language2'] = 50
-            self.d['language3'] = 40
-            self.d['history'] = 40
-            self.d['humint'] = 50
-            self.d['law'] = 40
-            self.d['persuade'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-
-        if profession == 'Intelligence Analyst':
-
-            self.d['anthropology'] = 40
-            self.d['bureaucracy'] = 50
-            self.d['computer science'] = 40
-            self.d['criminology'] = 40
-            self.d['language1'] = 50
-            self.d['language2'] = 50
-            self.d['language3'] = 40
-            self.d['history'] = 40
-            self.d['humint'] = 50
-            self.d['sigint'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-
-        if profession == 'Intelligence Case Officer':
-
-            self.d['alertness'] = 50
-            self.d['bureaucracy'] = 40
-            self.d['criminology'] = 50
-            self.d['disguise'] = 50
-            self.d['drive'] = 40
-            self.d['firearms'] = 40
-            self.d['language1'] = 50
-            self.d['language2'] = 40
-            self.d['humint'] = 60
-            self.d['sigint'] = 40
-            self.d['stealth'] = 50
-            self.d['unarmed combat'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-
-        if profession == 'Lawyer' or profession == 'Business Executive':
-
-            self.d['accounting'] = 50
-            self.d['bureaucracy'] = 50
-            self.d['humint'] = 40
-            self.d['persuade'] = 60
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('computer science', 50),
-                ('criminology', 60),
-                ('language1', 50),
-                ('law', 50),
-                ('pharmacy', 50),
-            ])
-            choice1, choice2, choice3, choice4 = sample(possible, 4)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-            self.d[choice3[0]] = choice3[1]
-            self.d[choice4[0]] = choice4[1]
-
-        if profession == 'Media Specialist':
-
-            self.d['art1value'] = 60
-            self.d['history'] = 40
-            self.d['humint'] = 40
-            self.d['persuade'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('anthropology', 40),
-                ('archeology', 40),
-                ('art2value', 40),
-                ('bureaucracy', 50),
-                ('computer science', 40),
-                ('criminology', 50),
-                ('language1', 40),
-                ('law', 40),
-                ('military science', 40),
-                ('occult', 50),
-                ('science1value', 40),
-            ])
-            choice1, choice2, choice3, choice4, choice5 = sample(possible, 5)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-            self.d[choice3[0]] = choice3[1]
-            self.d[choice4[0]] = choice4[1]
-            self.d[choice5[0]] = choice5[1]
-
-        if profession == 'Nurse' or profession == 'Paramedic':
-
-            self.d['alertness'] = 40
-            self.d['bureaucracy'] = 40
-            self.d['first aide'] = 60
-            self.d['humint'] = 40
-            self.d['medicine'] = 40
-            self.d['persuade'] = 40
-            self.d['pharmacy'] = 40
-            self.d['science1label'] = 'Biology'
-            self.d['science1value'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('drive', 60),
-                ('forensics', 40),
-                ('navigate', 50),
-                ('psychotherapy', 50),
-                ('search', 60),
-            ])
-            choice1, choice2 = sample(possible, 2)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-
-        if profession == 'Physician':
-
-            self.d['bureaucracy'] = 50
-            self.d['first aide'] = 60
-            self.d['medicine'] = 60
-            self.d['persuade'] = 40
-            self.d['pharmacy'] = 50
-            self.d['science1label'] = 'Biology'
-            self.d['science1value'] = 60
-            self.d['search'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            possible = set([
-                ('forensics', 50),
-                ('psychotherapy', 60),
-                ('science2value', 50),
-                ('surgery', 50),
-            ])
-            choice1, choice2 = sample(possible, 2)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-
-        if profession == 'Pilot' or profession == 'Sailor':
-
-            self.d['alertness'] = 60
-            self.d['bureaucracy'] = 30
-            self.d['craft1label'] = 'Electrician'
-            self.d['craft1value'] = 40
-            self.d['craft2label'] = 'Mechanic'
-            self.d['craft2value'] = 40
-            self.d['navigate'] = 50
-            self.d['pilot1'] = 60
-            self.d['science1label'] = 'Meteorology'
-            self.d['science1value'] = 40
-            self.d['swim'] = 40
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            possible = set([
-                ('language1', 50),
-                ('pilot2', 50),
-                ('heavy weapons', 50),
-                ('military science', 50),
-            ])
-            choice1, choice2 = sample(possible, 2)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-
-        if profession == 'Police Officer':
-
-            self.d['alertness'] = 60
-            self.d['bureaucracy'] = 40
-            self.d['criminology'] = 50
-            self.d['drive'] = 50
-            self.d['firearms'] = 40
-            self.d['first aide'] = 30
-            self.d['humint'] = 50
-            self.d['law'] = 30
-            self.d['melee weapons'] = 50
-            self.d['navigate'] = 40
-            self.d['persuade'] = 40
-            self.d['search'] = 50
-            self.d['unarmed combat'] = 60
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            possible = set([
-                ('forensics', 50),
-                ('heavy machinery', 60),
-                ('heavy weapons', 50),
-                ('ride', 60),
-            ])
-            choice1 = sample(possible, 1)[0]
-            self.d[choice1[0]] = choice1[1]
-
-        if profession == 'Program Manager':
-
-            self.d['accounting'] = 60
-            self.d['bureaucracy'] = 60
-            self.d['computer science'] = 50
-            self.d['criminology'] = 30
-            self.d['language1'] = 50
-            self.d['history'] = 40
-            self.d['law'] = 40
-            self.d['persuade'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('anthropology', 30),
-                ('art1value', 30),
-                ('craft1value', 30),
-                ('science1value', 30),
-            ])
-            choice1 = sample(possible, 1)[0]
-            self.d[choice1[0]] = choice1[1]
-
-        if profession == 'Scientist':
-
-            self.d['bureaucracy'] = 40
-            self.d['computer science'] = 40
-            self.d['science1value'] = 60
-            self.d['science2value'] = 50
-            self.d['science3value'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('accounting', 50),
-                ('craft1value', 40),
-                ('language1', 40),
-                ('forensics', 40),
-                ('law', 40),
-                ('pharmacy', 40),
-            ])
-            choice1, choice2, choice3 = sample(possible, 3)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-            self.d[choice3[0]] = choice3[1]
-
-        if profession == 'Soldier' or profession == 'Marine':
-
-            self.d['alertness'] = 50
-            self.d['athletics'] = 50
-            self.d['bureaucracy'] = 30
-            self.d['drive'] = 40
-            self.d['firearms'] = 40
-            self.d['first aide'] = 40
-            self.d['military science'] = 40
-            self.d['milsci label'] = 'Land'
-            self.d['navigate'] = 40
-            self.d['persuade'] = 30
-            self.d['unarmed combat'] = 50
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
-            self.d['bond3'] = self.d['charisma']
-            self.d['bond4'] = self.d['charisma']
-            possible = set([
-                ('artillery', 40),
-                ('computer science', 40),
-                ('demolitions', 40),
-                ('language1', 40),
-                ('heavy machinery', 50),
-                ('heavy weapons', 40),
-                ('search', 60),
-                ('sigint', 40),
-                ('swim', 60),
-            ])
-            choice1, choice2, choice3 = sample(possible, 3)
-            self.d[choice1[0]] = choice1[1]
-            self.d[choice2[0]] = choice2[1]
-            self.d[choice3[0]] = choice3[1]
-
-        if profession == 'Special Operator':
-
-            self.d['alertness'] = 60
-            self.d['athletics'] = 60
-            self.d['demolitions'] = 40
-            self.d['firearms'] = 60
-            self.d['heavy weapons'] = 50
-            self.d['melee weapons'] = 50
-            self.d['military science'] = 60
-            self.d['navigate'] = 50
-            self.d['stealth'] = 50
-            self.d['survival'] = 50
-            self.d['swim'] = 50
-            self.d['unarmed combat'] = 60
-            self.d['bond1'] = self.d['charisma']
-            self.d['bond2'] = self.d['charisma']
+        self.d.update(DEFAULT_SKILLS)
+
+        # Profession
+        template = PROFESSION_REGISTRY.get(profession)
+        if template is not None:
+            skills, choices, picks, bonds = template
+            self.d.update(skills)
+            for bond in bonds:
+                self.d[bond] = self.d['charisma']
+            if picks:
+                self.d.update(rng.sample(choices, picks))
 
         # bonus points
-
-        possible_bonus_skills = set([
-            'accounting',
-            'alertness',
-            'anthropology',
-            'archeology',
-            'art1value',
-            'artillery',
-            'athletics',
-            'bureaucracy',
-            'computer science',
-            'craft1value',
-            'criminology',
-            'demolitions',
-            'disguise',
-            'dodge',
-            'drive',
-            'firearms',
-            'first aide',
-            'forensics',
-            'heavy machinery',
-            'heavy weapons',
-            'history',
-            'humint',
-            'law',
-            'medicine',
-            'melee weapons',
-            'military science',
-            'navigate',
-            'occult',
-            'persuade',
-            'pharmacy',
-            'pilot1',
-            'psychotherapy',
-            'ride',
-            'science1value',
-            'search',
-            'sigint',
-            'stealth',
-            'surgery',
-            'survival',
-            'swim',
-            'unarmed combat',
-            'language1',
-        ])
-        
-       
-        if bonus_package == 'artist' or bonus_package == 'actor' or bonus_package == 'musician':
-            self.bonus_skills = set([
-                'alertness',
-                'craft1value',
-                'disguise',
-                'persuade',
-                'art1value',
-                'art2value',
-                'art3value',
-                'humint',
-            ])
-        
-        if bonus_package == 'athlete':
-            self.bonus_skills = set([
-                'alertness',
-                'athletics',
-                'dodge',
-                'first aide',
-                'humint',
-                'persuade',
-                'swim',
-                'unarmed combat',
-            ])
-        
-        if bonus_package == 'author' or bonus_package == 'editor' or bonus_package == 'journalist':
-            self.bonus_skills = set([
-                'anthropology',
-                'art1value',
-                'bureaucracy',
-                'history',
-                'law',
-                'occult',
-                'persuade',
-                'humint',
-            ])
-        
-        if bonus_package == 'black bag training' or bonus_package == 'blackbag':
-        
-            l1,v1 = self.setLabelSkill('craft','Electrician')
-            l2,v2 = self.setLabelSkill('craft','Locksmithing')
-            
-            self.bonus_skills = set([
-                'alertness',
-                'athletics',
-                v1,
-                v2,
-                'criminology',
-                'disguise',
-                'search',
-                'stealth',
-            ])
-            
-        if bonus_package == 'blue-collar worker' or bonus_package == 'bluecollar':
-            self.bonus_skills = set([
-                'alertness',
-                'craft1value',
-                'craft2value',
-                'drive',
-                'fisrt aide',
-                'heavy machinery',
-                'navigate',
-                'search',
-            ])
-            
-        if bonus_package == 'bureaucrat':
-            self.bonus_skills = set([
-                'accounting',
-                'bureaucracy',
-                'computer science',
-                'criminology',
-                'humint',
-                'law',
-                'persuade',
-            ])    
-            self.bonus_skills = self.bonus_skills.union(sample(possible_bonus_skills - self.bonus_skills,1))
-        
-        if bonus_package == 'clergy':
-            self.bonus_skills = set([
-                'language1',
-                'language2',
-                'language3',
-                'history',
-                'humint',
-                'occult',
-                'persuade',
-                'psychotherapy',
-            ])
-            
-        if bonus_package == 'combat veteran' or bonus_package == 'veteran':
-            self.bonus_skills = set([
-                'alertness',
-                'dodge',
-                'firearms',
-                'first aide',
-                'heavy weapons',
-                'melee weapons',
-                'stealth',
-                'unarmed combat',
-            ])
-                
-        if bonus_package == 'computer enthusiast' or bonus_package == 'hacker':
-            l1,v1 = self.setLabelSkill('craft','Microelectronics')
-            l2,v2 = self.setLabelSkill('science','Mathematics')
-            self.bonus_skills = set([
-                'computer science',
-                'sigint',
-                v1,
-                v2,
-            ])
-            self.bonus_skills = self.bonus_skills.union(sample(possible_bonus_skills - self.bonus_skills,4))
-        
-        
-        if bonus_package == 'counselor':
-            self.bonus_skills = set([
-                'bureaucracy',
-                'first aide',
-                'language1',
-                'humint',
-                'law',
-                'persuade',
-                'psychotherapy',
-                'search',
-            ])
-        
-        if bonus_package == 'criminalist':
-            self.bonus_skills = set([
-                'accounting',
-                'bureaucracy',
-                'computer science',
-                'criminology',
-                'forensics',
-                'law',
-                'pharmacy',
-                'search',
-            ])
-            
-        if bonus_package == 'firefighter':
-            self.bonus_skills = set([
-                'alertness',
-                'demolitions',
-                'drive',
-                'first aide',
-                'forensics',
-                'heavy machinery',
-                'navigate',
-                'search',
-            ])  
-            
-        if bonus_package == 'gangster' or bonus_package == 'deep cover':
-            self.bonus_skills = set([
-                'alertness',
-                'criminology',
-                'dodge',
-                'drive',
-                'persuade',
-                'stealth',
-            ])  
-            
-            possible = set([
-                'athletics',
-                'language1',
-                'firearms',
-                'humint',
-                'melee weapons',
-                'pharmacy',
-                'unarmed combat',
-            ])
-            self.bonus_skills = self.bonus_skills.union(sample(possible,2))
-        
-                
-        if bonus_package == 'interrogator':
-            self.bonus_skills = set([
-                'criminology',
-                'language1',
-                'language2',
-                'humint',
-                'law',
-                'persuade',
-                'pharmacy',
-                'search',
-            ])
-            
-        if bonus_package == 'liberal arts degree' or bonus_package == 'arts':
-            self.bonus_skills = set([
-                'art1value',
-                'language1',
-                'history',
-                'persuade',
-            ])
-            possible = set([
-                'anthropology',
-                'archeology',
-            ])
-            self.bonus_skills = self.bonus_skills.union(sample(possible,1))
-            self.bonus_skills = self.bonus_skills.union(sample(possible_bonus_skills - self.bonus_skills,3))
-            
-        if bonus_package == 'military officer' or bonus_package == 'military':
-            self.bonus_skills = set([
-                'bureaucracy',
-                'firearms',
-                'history',
-                'military science',
-                'navigate',
-                'persuade',
-                'unarmed combat',
-            ])
-            possible = set([
-                'artillery',
-                'heavy machinery',
-                'heavy weapons',
-                'humint',
-                'pilot1',
-                'sigint',
-            ])
-            self.bonus_skills = self.bonus_skills.union(sample(possible,1))
-            
-        if bonus_package == 'mba':
-            self.bonus_skills = set([
-                'accounting',
-                'bureaucracy',
-                'humint',
-                'law',
-                'persuade',
-            ])    
-            self.bonus_skills = self.bonus_skills.union(sample(possible_bonus_skills - self.bonus_skills,3))
-            
-        if bonus_package == 'nurse' or bonus_package == 'paramedic' or bonus_package == 'premed' or bonus_package == 'pre-med':
-            l,v = self.setLabelSkill('science','Biology')
-            self.bonus_skills = set([
-                'alertness',
-                'first aide',
-                'medicine',
-                'persuade',
-                'pharmacy',
-                'psychotherapy',
-                'search',
-                v,
-            ])    
-            
-        if bonus_package == 'occult investigator' or bonus_package == 'occult' or bonus_package == 'conspiracy theorist' or bonus_package == 'conspiracy':
-            self.bonus_skills = set([
-                'anthropology',
-                'archeology',
-                'computer science',
-                'criminology',
-                'history',
-                'occult',
-                'persuade',
-                'search',
-            ])    
-            
-        if bonus_package == 'outdoorsman':
-            self.bonus_skills = set([
-                'alertness',
-                'athletics',
-                'firearms',
-                'navigate',
-                'ride',
-                'search',
-                'stealth',
-                'survival',
-            ])    
-            
-        if bonus_package == 'photographer':
-            l,v = self.setLabelSkill('art','Photography')
-            self.bonus_skills = set([
-                'alertness',
-                'computer science',
-                'persuade',
-                'search',
-                'stealth',
-                v,
-            ])    
-            self.bonus_skills = self.bonus_skills.union(sample(possible_bonus_skills - self.bonus_skills,2))
-        
-        if bonus_package == 'pilot' or bonus_package == 'sailor':
-            l,v = self.setLabelSkill('craft','Mechanic')
-            self.bonus_skills = set([
-                'alertness',
-                'first aide',
-                'language1',
-                'navigate',
-                'pilot1',
-                'survival',
-                'swim',
-                v,
-            ])    
-            
-        if bonus_package == 'police officer' or bonus_package == 'police':
-            self.bonus_skills = set([
-                'alertness',
-                'criminology',
-                'drive',
-                'firearms',
-                'humint',
-                'law',
-                'melee weapons',
-                'unarmed combat',
-            ])     
-         
-        if bonus_package == 'science grad student' or bonus_package == 'science':
-            self.bonus_skills = set([
-                'bureaucracy',
-                'computer use',
-                'craft1value'
-                'language1',
-                'science1value',
-                'science2value',
-                'science3value',
-            ]) 
-            possible = set([
-                'accounting',
-                'forensics',
-                'law',
-                'pharmacy',
-            ])
-            self.bonus_skills = self.bonus_skills.union(sample(possible,1))
-            
-        if bonus_package == 'social worker' or bonus_package == 'social' or bonus_package == 'criminal justice degree':
-            self.bonus_skills = set([
-                'bureaucracy',
-                'criminology',
-                'forensics'
-                'language1',
-                'humint',
-                'law',
-                'persuade',
-                'search',
-            ]) 
-            
-        if bonus_package == 'soldier' or bonus_package == 'marine':
-            self.bonus_skills = set([
-                'alertness',
-                'artillery',
-                'athletics'
-                'drive',
-                'firearms',
-                'heavy weapons',
-                'military science',
-                'unarmed combat',
-            ]) 
-            
-        if bonus_package == 'translator':
-            self.bonus_skills = set([
-                'anthropology',
-                'language1',
-                'language2'
-                'language3',
-                'history',
-                'humint',
-                'persuade',
-            ]) 
-            self.bonus_skills = self.bonus_skills.union(sample(possible_bonus_skills - self.bonus_skills,1))
-         
-        if bonus_package == 'urban explorer':
-            self.bonus_skills = set([
-                'alertness',
-                'athletics',
-                'craft1value'
-                'law',
-                'navigate',
-                'persuade',
-                'search',
-                'stealth',
-            ]) 
-        
-         
-        if bonus_package == 'random':
-            self.bonus_skills = sample(possible_bonus_skills, 8)    
-        
-        # apply bonus skills
+        package = BONUS_REGISTRY.get(bonus_package)
+        if package is not None:
+            labels, skills, picks = package
+            self.bonus_skills = set(skills)
+            for prefix, label in labels:
+                key, value = self.setLabelSkill(prefix, label)
+                if value is not None:
+                    self.bonus_skills.add(value)
+            for pool, count in picks:
+                if pool is None:
+                    pool = [skill for skill in POSSIBLE_BONUS_SKILLS
+                            if skill not in self.bonus_skills]
+                self.bonus_skills.update(rng.sample(pool, count))
+
+        # apply bonus skills, sorted so new keys land in a stable order
+        self.bonus_skills = tuple(sorted(self.bonus_skills))
         for skill in self.bonus_skills:
             #print("BOOST ",skill)
             boost = self.d.get(skill, 0) + 20
@@ -1013,17 +1819,11 @@ class Need2KnowCharacter(object):
                 boost = 80
             self.d[skill] = boost
 
+        # Rolled in a plain dict, kept as a compact record
+        self.d = CharacterRecord.from_dict(self.d)
+
     def setLabelSkill(self,prefix,label):
-        for n in range(1,4):
-            key = prefix + str(n) + 'label'
-            value = prefix + str(n) + 'value'
-            if key not in self.d:
-                self.d[key] = label
-                return key, value
-            elif self.d[key] == label:
-                return key, value
-                    
-        return None, None
+        return claim_label(self.d, prefix, label)
         
         
         
@@ -1077,124 +1877,701 @@ class Need2KnowCharacter(object):
                 else:
                     mark = ""
                 print(k," ",self.d[k],mark)
-    
+
+
+def generate(profession_list=PROFESSIONS, number=1, sex='b',
+             bonus_package='random', seed=None, names=None):
+    # Lazily yield number agents of each profession in roster order: for
+    # sex 'b' each female is followed by a male, as on the printed roster.
+    # With a seed, agents are numbered within their profession and seeded
+    # by agent_seed.  With names, a UniqueNames, they are named by it.
+    genders = []
+    if(sex == 'f' or sex == 'b'):
+        genders.append('female')
+    if(sex == 'm' or sex == 'b'):
+        genders.append('male')
+    for profession in profession_list:
+        index = 0
+        for x in range(number):
+            for gender in genders:
+                yield Need2KnowCharacter(
+                    gender=gender, profession=profession,
+                    bonus_package=bonus_package,
+                    seed=agent_seed(seed, profession, index),
+                    name=names and names.name(profession, gender, index))
+                index += 1
+
+
+def per_profession(number, sex):
+    # Agents of each profession on a roster of number per sex
+    return number * (2 if sex == 'b' else 1)
+
+
+def roster_agents(profession_list, number, sex, first, count):
+    # (profession, gender, index within the profession) of agents first ..
+    # first+count-1 of the roster generate() would yield
+    genders = []
+    if(sex == 'f' or sex == 'b'):
+        genders.append('female')
+    if(sex == 'm' or sex == 'b'):
+        genders.append('male')
+    each = per_profession(number, sex)
+    for index in range(first, first + count):
+        n = index % each
+        yield (profession_list[index // each], genders[n % len(genders)], n)
+
+
+def roster_slice(profession_list, number, sex, bonus_package, seed, first,
+                 count, names=None):
+    # The agents of roster_agents(), without rolling the ones before them
+    for profession, gender, n in roster_agents(profession_list, number, sex,
+                                               first, count):
+        yield Need2KnowCharacter(gender=gender, profession=profession,
+                                 bonus_package=bonus_package,
+                                 seed=agent_seed(seed, profession, n),
+                                 name=names and names.name(profession, gender,
+                                                           n))
+
+
+def generate_batch(profession, number, bonus_package='random', rng=None):
+    # Roll number agents of one profession at once with NumPy, for balance
+    # studies rather than printing.  Returns a dict with an int16 array per
+    # numeric sheet field (0 where an agent lacks the skill), 'damage bonus'
+    # as its integer modifier and the batch's labels as plain strings.
+    numpy = optional_import('numpy')
+    if numpy is None:
+        raise ImportError('numpy is required for batch generation')
+    if rng is None:
+        rng = numpy.random.default_rng()
+    fields = [f for f in Need2KnowPDF.field_xy if not is_text_field(f)]
+    index = {f: n for n, f in enumerate(fields)}
+    values = numpy.zeros((number, len(fields)), dtype=numpy.int16)
+    rows = numpy.arange(number)[:, None]
+
+    # Spend the Point Pool: one pool per agent, each row shuffled
+    pools = numpy.array(Need2KnowCharacter.statpools, dtype=numpy.int16)
+    stats = rng.permuted(pools[rng.integers(len(pools), size=number)], axis=1)
+    for n, stat in enumerate(Need2KnowPDF.x5_stats):
+        values[:, index[stat]] = stats[:, n]
+
+    # Derived Stats
+    strength, constitution, power = stats[:, 0], stats[:, 1], stats[:, 4]
+    values[:, index['hitpoints']] = numpy.round((strength + constitution) / 2.0)
+    values[:, index['willpower']] = power
+    values[:, index['sanity']] = power * 5
+    values[:, index['breaking point']] = power * 4
+
+    for skill, value in DEFAULT_SKILLS.items():
+        values[:, index[skill]] = value
+
+    # Profession: fixed skills, bonds, then picks drawn column-wise by
+    # ranking a row of random keys per agent
+    labels = {}
+    template = PROFESSION_REGISTRY.get(profession)
+    if template is not None:
+        skills, choices, picks, bonds = template
+        for skill, value in skills.items():
+            if is_text_field(skill):
+                labels[skill] = value
+            else:
+                values[:, index[skill]] = value
+        for bond in bonds:
+            values[:, index[bond]] = stats[:, 5]
+        if picks:
+            chosen = rng.random((number, len(choices))).argsort(axis=1)[:, :picks]
+            for n, (skill, value) in enumerate(choices):
+                values[(chosen == n).any(axis=1), index[skill]] = value
+
+    # bonus points, tracked as a boolean agent x field matrix
+    package = BONUS_REGISTRY.get(bonus_package)
+    if package is not None:
+        package_labels, skills, picks = package
+        boosted = numpy.zeros((number, len(fields)), dtype=bool)
+        for skill in skills:
+            boosted[:, index[skill]] = True
+        for prefix, label in package_labels:
+            key, value = claim_label(labels, prefix, label)
+            if value is not None:
+                boosted[:, index[value]] = True
+        for pool, count in picks:
+            columns = numpy.array([index[skill] for skill in
+                                   (POSSIBLE_BONUS_SKILLS if pool is None else pool)])
+            keys = rng.random((number, len(columns)))
+            if pool is None:
+                # Free picks never land on an already boosted skill
+                keys[boosted[:, columns]] = 2.0
+            chosen = keys.argsort(axis=1)[:, :count]
+            boosted[rows, columns[chosen]] = True
+        values = numpy.where(boosted, numpy.minimum(values + 20, 80), values)
+
+    batch = {field: values[:, n] for n, field in enumerate(fields)}
+    batch['damage bonus'] = ((strength - 1) >> 2) - 2
+    batch.update(labels)
+    return batch
+
+
+class Roster(object):
+    # Agents stored column-wise for threshold queries over large rosters.
+    # Numeric fields go in one int16 row per field (MISSING where an agent
+    # lacks it); name, nationality and age in plain lists; the rest of the
+    # text, a handful of combinations, as an id into self.templates; bonus
+    # skills as a bitmask over FIELD_INDEX.  Appended agents wait in a row
+    # buffer until the next query moves them into the columns.  Indexes are
+    # built per field on first use: one packed bitmap of the agents at or
+    # above each value the field takes, so a conjunctive query is a few
+    # ANDs of n/8 bytes.  Needs NumPy.
+    #
+    #     roster = Roster(generate(PROFESSIONS, 1000, seed='x'))
+    #     hits = roster.query([('psychotherapy', 60), ('power', 14)], 'Nurse')
+    #     add_characters(pdf, roster.agents(hits))
+    FREE_TEXT = ('name', 'nationality', 'age')
+    WORDS = (len(NUMERIC_FIELDS) + 63) // 64
+
+    def __init__(self, characters=()):
+        self.numpy = optional_import('numpy')
+        if self.numpy is None:
+            raise ImportError('numpy is required for Roster')
+        self.columns = self.numpy.zeros((len(NUMERIC_FIELDS), 0),
+                                        dtype=self.numpy.int16)
+        self.rows = array('h')
+        self.text = {field: [] for field in self.FREE_TEXT}
+        self.templates = []
+        self.template_ids = {}
+        self.template = array('I')
+        self.bonus = array('Q')
+        self.seeds = []
+        self.indexes = {}
+        self.extend(characters)
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def append(self, character):
+        d = character.d
+        if not isinstance(d, CharacterRecord):
+            d = CharacterRecord.from_dict(d)
+        self.rows.extend(d.values)
+        # Text in its original order, free text left as None
+        template = tuple((key, None if key in self.text else value)
+                         for key, value in d.text.items())
+        n = self.template_ids.get(template)
+        if n is None:
+            n = self.template_ids[template] = len(self.templates)
+            self.templates.append(template)
+        self.template.append(n)
+        for field in self.FREE_TEXT:
+            self.text[field].append(d.text.get(field))
+        mask = 0
+        for skill in character.bonus_skills:
+            mask |= 1 << FIELD_INDEX[skill]
+        for word in range(self.WORDS):
+            self.bonus.append(mask >> (64 * word) & 0xFFFFFFFFFFFFFFFF)
+        self.seeds.append(character.seed)
+
+    def extend(self, characters):
+        for character in characters:
+            self.append(character)
+
+    def freeze(self):
+        # Move buffered rows into the columns; indexes start over
+        if self.rows:
+            numpy = self.numpy
+            block = numpy.frombuffer(self.rows, dtype=numpy.int16)
+            self.columns = numpy.concatenate(
+                [self.columns, block.reshape(-1, len(NUMERIC_FIELDS)).T],
+                axis=1)
+            self.rows = array('h')
+            self.indexes = {}
+
+    def column(self, field):
+        self.freeze()
+        return self.columns[FIELD_INDEX[field]]
+
+    def at_least(self, field, threshold):
+        # Packed bitmap of the agents with field at threshold or more.
+        # Freezing first drops the indexes if agents were appended since.
+        numpy = self.numpy
+        self.freeze()
+        index = self.indexes.get(field)
+        if index is None:
+            column = self.column(field)
+            values = numpy.unique(column)
+            index = self.indexes[field] = (values, [
+                numpy.packbits(column >= value) for value in values])
+        values, bitmaps = index
+        n = int(numpy.searchsorted(values, threshold))
+        if n == len(values):
+            return numpy.zeros((len(self) + 7) // 8, dtype=numpy.uint8)
+        return bitmaps[n]
+
+    def having(self, key, value):
+        # Packed bitmap of the agents with text key at value, e.g. a
+        # profession
+        numpy = self.numpy
+        self.freeze()
+        index = self.indexes.get((key, value))
+        if index is None:
+            ids = [n for n, template in enumerate(self.templates)
+                   if (key, value) in template]
+            template = numpy.frombuffer(self.template, dtype=numpy.uint32)
+            index = self.indexes[key, value] = numpy.packbits(
+                numpy.isin(template, ids))
+        return index
+
+    def query(self, thresholds=(), profession=None):
+        # Positions, in roster order, of the agents of the profession (any
+        # if None) with every (field, threshold) at threshold or more
+        numpy = self.numpy
+        self.freeze()
+        bits = None
+        if profession is not None:
+            bits = self.having('profession', profession)
+        for field, threshold in thresholds:
+            found = self.at_least(field, threshold)
+            bits = found if bits is None else bits & found
+        if bits is None:
+            return numpy.arange(len(self))
+        return numpy.flatnonzero(numpy.unpackbits(bits, count=len(self)))
+
+    def agent(self, n):
+        # Agent n as a Need2KnowCharacter, as it was appended
+        self.freeze()
+        record = CharacterRecord.__new__(CharacterRecord)
+        record.values = array('h', self.columns[:, n].tobytes())
+        record.text = {key: self.text[key][n] if value is None else value
+                       for key, value in self.templates[self.template[n]]}
+        mask = 0
+        for word in range(self.WORDS):
+            mask |= self.bonus[n * self.WORDS + word] << (64 * word)
+        character = Need2KnowCharacter.__new__(Need2KnowCharacter)
+        character.d = record
+        character.bonus_skills = tuple(sorted(
+            field for n, field in enumerate(NUMERIC_FIELDS) if mask >> n & 1))
+        character.seed = self.seeds[n]
+        return character
+
+    def agents(self, positions=None):
+        # The agents at positions (all by default), ready for add_characters
+        # or any exporter
+        if positions is None:
+            positions = range(len(self))
+        for n in positions:
+            yield self.agent(int(n))
+
+
+# Archetype odds of reaching a skill threshold, see skill_reach()
+_REACH = {}
+# Exact field distributions per (profession, bonus package), and 'stats'
+_DISTRIBUTIONS = {}
+# Draws per archetype and agent slot before build_party() tries another
+PARTY_ATTEMPTS = 64
+
+
+# Short names of the stats for threshold_spec()
+STAT_NAMES = {
+    'str': 'strength',
+    'con': 'constitution',
+    'dex': 'dexterity',
+    'int': 'intelligence',
+    'pow': 'power',
+    'cha': 'charisma',
+}
+
+
+def threshold_spec(value):
+    # argparse type of --where: SKILL>=VALUE with a numeric sheet field or
+    # a stat's short name.  Returns (field, threshold).
+    field, sep, threshold = value.partition('>=')
+    field = field.strip().lower()
+    field = STAT_NAMES.get(field, field)
+    if not sep or field not in FIELD_INDEX or not threshold.strip().isdigit():
+        raise argparse.ArgumentTypeError(
+            "expected SKILL>=VALUE with a numeric sheet field")
+    return field, int(threshold)
+
+
+def need_spec(value):
+    # argparse type of --need: [N:|all:]SKILL>=VALUE, at least N agents
+    # (default 1) or all of them with SKILL at VALUE or more.  Returns
+    # (skill, threshold, count) with count None for all.
+    count, sep, rest = value.rpartition(':')
+    if not (count in ('', 'all') or count.isdigit() and int(count)):
+        raise argparse.ArgumentTypeError(
+            "expected [N:|all:]SKILL>=VALUE with a numeric sheet field")
+    skill, threshold = threshold_spec(rest)
+    return (skill, threshold, None if count == 'all' else int(count or 1))
+
+
+def format_need(need):
+    skill, threshold, count = need
+    prefix = 'all:' if count is None else '' if count == 1 else '%d:' % count
+    return '%s%s>=%d' % (prefix, skill, threshold)
+
+
+def stat_values():
+    # Exact distribution of every value derived from the point pool: one
+    # of the statpools, uniformly, in a uniformly shuffled order.  Every
+    # stat sees each entry of the pool with probability 1/6; hit points
+    # come from an ordered pair of distinct entries.
+    try:
+        return _DISTRIBUTIONS['stats']
+    except KeyError:
+        pass
+    stat = {}
+    hitpoints = {}
+    pools = Need2KnowCharacter.statpools
+    for pool in pools:
+        for value in pool:
+            stat[value] = stat.get(value, 0) + Fraction(1, 6 * len(pools))
+        for i in range(6):
+            for j in range(6):
+                if i != j:
+                    value = int(round((pool[i] + pool[j]) / 2.0))
+                    hitpoints[value] = (hitpoints.get(value, 0) +
+                                        Fraction(1, 30 * len(pools)))
+    tables = {name: stat for name in Need2KnowPDF.x5_stats}
+    tables['hitpoints'] = hitpoints
+    tables['willpower'] = stat
+    tables['sanity'] = {v * 5: p for v, p in stat.items()}
+    tables['breaking point'] = {v * 4: p for v, p in stat.items()}
+    damage = {}
+    for v, p in stat.items():
+        key = 'DB=%d' % (((v - 1) >> 2) - 2)
+        damage[key] = damage.get(key, 0) + p
+    tables['damage bonus'] = damage
+    _DISTRIBUTIONS['stats'] = tables
+    return tables
+
+
+def boost_odds(profession, bonus_package):
+    # Exact probability that the bonus package boosts each skill of an
+    # agent of this profession.  Labels land where the profession's own
+    # labels leave room; picks from fixed pools are enumerated as weighted
+    # sets of boosted skills, and the free picks after them, a uniform
+    # sample of what POSSIBLE_BONUS_SKILLS has left, are counted directly.
+    package = BONUS_REGISTRY.get(bonus_package)
+    if package is None:
+        return {}
+    labels, skills, picks = package
+    d = dict(PROFESSION_REGISTRY.get(profession, ({},))[0])
+    boosted = set(skills)
+    for prefix, label in labels:
+        key, value = claim_label(d, prefix, label)
+        if value is not None:
+            boosted.add(value)
+    last = max([n for n, (pool, count) in enumerate(picks)
+                if pool is not None] or [-1])
+    states = {frozenset(boosted): Fraction(1)}
+    for pool, count in picks[:last + 1]:
+        drawn = {}
+        for state, p in states.items():
+            candidates = pool if pool is not None else [
+                s for s in POSSIBLE_BONUS_SKILLS if s not in state]
+            sets = list(combinations(candidates, count))
+            for picked in sets:
+                key = state.union(picked)
+                drawn[key] = drawn.get(key, 0) + p / len(sets)
+        states = drawn
+    free = sum(count for pool, count in picks[last + 1:])
+    odds = {}
+    for state, p in states.items():
+        for skill in state:
+            odds[skill] = odds.get(skill, 0) + p
+        if free:
+            rest = [s for s in POSSIBLE_BONUS_SKILLS if s not in state]
+            for skill in rest:
+                odds[skill] = odds.get(skill, 0) + p * Fraction(free, len(rest))
+    return odds
+
+
+def field_values(profession, bonus_package, field):
+    # Exact distribution of one numeric sheet field (or the damage bonus)
+    # of an agent of this profession and bonus package, as {value:
+    # Fraction}, value None where the agent may lack the field.  The
+    # profession's sample() of its choices takes each with probability
+    # picks / len(choices), independently of the bonus package's boosts
+    # (+20, at most 80).
+    stats = stat_values()
+    skills, choices, picks, bonds = PROFESSION_REGISTRY.get(
+        profession, ({}, (), 0, ()))
+    if field in stats:
+        return stats[field]
+    if field.startswith('bond'):
+        return stats['charisma'] if field in bonds else {None: Fraction(1)}
+    try:
+        boosts = _DISTRIBUTIONS['boosts', profession, bonus_package]
+    except KeyError:
+        boosts = boost_odds(profession, bonus_package)
+        _DISTRIBUTIONS['boosts', profession, bonus_package] = boosts
+    value = skills.get(field, DEFAULT_SKILLS.get(field))
+    branches = [(Fraction(1), value)]
+    chosen = dict(choices).get(field)
+    if chosen is not None and picks:
+        q = Fraction(min(picks, len(choices)), len(choices))
+        branches = [(1 - q, value), (q, chosen)]
+    boost = boosts.get(field, 0)
+    values = {}
+    for p, v in branches:
+        for p, v in ((p * (1 - boost), v),
+                     (p * boost, min((v or 0) + 20, 80))):
+            if p:
+                values[v] = values.get(v, 0) + p
+    return values
+
+
+def skill_distribution(profession, bonus_package):
+    # field_values() of every field an agent of this profession and bonus
+    # package may have, as {field: {value: Fraction}}, memoized per
+    # (profession, bonus package)
+    try:
+        return _DISTRIBUTIONS[profession, bonus_package]
+    except KeyError:
+        pass
+    tables = {}
+    for field in NUMERIC_FIELDS + ('damage bonus',):
+        values = field_values(profession, bonus_package, field)
+        if values != {None: 1}:
+            tables[field] = values
+    _DISTRIBUTIONS[profession, bonus_package] = tables
+    return tables
+
+
+def skill_odds(profession, bonus_package, skill, threshold):
+    # Probability that an agent of this profession and bonus package has
+    # skill at threshold or more, see field_values()
+    return float(sum(p for v, p in
+                     field_values(profession, bonus_package, skill).items()
+                     if v is not None and v >= threshold))
+
+
+def write_distributions(filename, profession_list, packages, fmt='json'):
+    # skill_distribution() of every profession and bonus package: CSV rows
+    # of profession, package, field, value, probability and the exact
+    # fraction, or with any other fmt a JSON document nested the same way.
+    # A value the agent may lack is written as ''.
+    def rows():
+        for profession in profession_list:
+            for bonus_package in packages:
+                tables = skill_distribution(profession, bonus_package)
+                for field, values in tables.items():
+                    for value in sorted(values, key=lambda v: (v is not None, v)):
+                        yield (profession, bonus_package, field,
+                               '' if value is None else value, values[value])
+    with open(filename, 'w', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(['profession', 'bonus_package', 'field', 'value',
+                             'probability', 'exact'])
+            for row in rows():
+                writer.writerow(row[:4] + (float(row[4]), str(row[4])))
+        else:
+            tree = {}
+            for profession, bonus_package, field, value, p in rows():
+                tree.setdefault(profession, {}).setdefault(
+                    bonus_package, {}).setdefault(field, {})[str(value)] = float(p)
+            json.dump(tree, f, indent=1)
+            f.write('\n')
+
+
+def skill_reach(skill, threshold):
+    # Every (odds, profession, bonus package) that can reach the threshold,
+    # likeliest first, computed once per process
+    try:
+        return _REACH[skill, threshold]
+    except KeyError:
+        pass
+    reach = []
+    for profession in PROFESSIONS:
+        for bonus_package in BONUS_PACKAGES + ('',):
+            odds = skill_odds(profession, bonus_package, skill, threshold)
+            if odds > 0:
+                reach.append((odds, profession, bonus_package))
+    reach.sort(key=lambda r: -r[0])
+    _REACH[skill, threshold] = reach
+    return reach
+
+
+def meets(character, need):
+    skill, threshold, count = need
+    return character.d.get(skill, 0) >= threshold
+
+
+def build_party(size, needs, profession_list=PROFESSIONS, packages=None,
+                sex='b', seed=None, budget=5.0, names=None):
+    # size agents meeting needs, (skill, threshold, count) tuples as from
+    # need_spec(), by depth first search over the party's slots.  Each slot
+    # takes the open need the fewest archetypes (profession, bonus package)
+    # can reach, tries those archetypes most promising first, and rolls
+    # agents of it until one meets that need, keeping whichever of a few
+    # covers the most other open needs too.  Returns (agents, unmet): when
+    # the search fails or runs out of budget seconds, the party that got
+    # closest, and (need, reason) for every need it misses.  With names, a
+    # UniqueNames, the agents are named by it once the party is settled.
+    deadline = time.perf_counter() + budget
+    # Packages by their first name, '' for none as with an unknown name
+    canonical = {name: names[0] for names in _BONUS_PACKAGES for name in names}
+    packages = [canonical.get(b, '') for b in packages or BONUS_PACKAGES]
+    allowed = set((p, b) for p in profession_list for b in packages)
+    genders = {'m': ['male'], 'f': ['female']}.get(sex, ['female', 'male'])
+    unmet = []
+    open_needs = []
+    for need in needs:
+        skill, threshold, count = need
+        if count is None:
+            count = size
+        candidates = [(odds, p, b) for odds, p, b in skill_reach(skill, threshold)
+                      if (p, b) in allowed]
+        if not candidates:
+            unmet.append((need, 'no allowed profession and bonus package '
+                                'reaches it'))
+        elif count > size:
+            unmet.append((need, 'needs %d agents, the party has %d' % (
+                count, size)))
+        else:
+            open_needs.append((need, count, candidates))
+    # Every agent has to meet the needs covering the whole party, so the
+    # archetypes of every other need narrow down to those that can
+    for every in [entry[0] for entry in open_needs if entry[1] == size]:
+        archetypes = [entry[2] for entry in open_needs if entry[0] is every]
+        if not archetypes:
+            continue
+        archetypes = set((p, b) for odds, p, b in archetypes[0])
+        narrowed = []
+        for need, count, candidates in open_needs:
+            candidates = [c for c in candidates if (c[1], c[2]) in archetypes]
+            if candidates:
+                narrowed.append((need, count, candidates))
+            else:
+                unmet.append((need, 'no allowed profession and bonus package '
+                                    'reaches it together with ' +
+                                    format_need(every)))
+        open_needs = narrowed
+
+    rng = random if seed is None else random.Random('%s/party' % seed)
+    rolls = [0]
+    best = [[], None]
+
+    def roll(slot, profession, bonus_package):
+        n = rolls[0]
+        rolls[0] += 1
+        return Need2KnowCharacter(
+            gender=genders[slot % len(genders)], profession=profession,
+            bonus_package=bonus_package,
+            seed=None if seed is None else '%s/party/%d' % (seed, n))
+
+    def missing(party):
+        return [need for need, count, candidates in open_needs
+                if sum(meets(c, need) for c in party) < count]
+
+    def search(party):
+        left = [(need, count - sum(meets(c, need) for c in party), candidates)
+                for need, count, candidates in open_needs]
+        left = [entry for entry in left if entry[1] > 0]
+        if best[1] is None or len(left) < best[1]:
+            best[:] = [list(party), len(left)]
+        if not left:
+            return party
+        slots = size - len(party)
+        if any(count > slots for need, count, candidates in left):
+            return None
+        need, count, candidates = min(left, key=lambda e: (len(e[2]), -e[1]))
+        others = [entry[0] for entry in left if entry[0] is not need]
+
+        def promise(candidate):
+            odds, p, b = candidate
+            return odds * (1 + sum(skill_odds(p, b, *other[:2])
+                                   for other in others))
+        # Equally promising archetypes come in random order
+        ranked = sorted(candidates, key=lambda c: (-promise(c), rng.random()))
+        for odds, profession, bonus_package in ranked:
+            chosen, covered = None, -1
+            found = 0
+            for attempt in range(PARTY_ATTEMPTS):
+                if time.perf_counter() > deadline:
+                    raise TimeoutError
+                agent = roll(len(party), profession, bonus_package)
+                if not meets(agent, need):
+                    continue
+                found += 1
+                cover = sum(meets(agent, other) for other in others)
+                if cover > covered:
+                    chosen, covered = agent, cover
+                if covered == len(others) or found == 4:
+                    break
+            if chosen is not None:
+                result = search(party + [chosen])
+                if result is not None:
+                    return result
+        return None
+
+    reason = 'no party found'
+    try:
+        party = search([]) or best[0]
+    except TimeoutError:
+        party = best[0]
+        reason = 'not met within %g seconds' % budget
+    # Unconstrained slots get random agents of the allowed archetypes
+    archetypes = sorted(allowed)
+    while len(party) < size:
+        party.append(roll(len(party), *rng.choice(archetypes)))
+    unmet.extend((need, reason) for need in missing(party))
+    if names is not None:
+        # Numbered within their profession as on a roster
+        counts = {}
+        for agent in party:
+            profession = agent.d['profession']
+            index = counts.get(profession, 0)
+            counts[profession] = index + 1
+            agent.d['name'] = names.name(
+                profession, 'male' if 'male' in agent.d else 'female', index)
+    return party, unmet
+
+
 class Need2KnowPDF(object):
 
     # Location of form fields in Points (1/72 inch). 0,0 is bottom-left
-    field_xy = {
-        # Personal Data
-        'name': (75, 693),
-        'profession': (343, 693),
-        'nationality': (343, 665),
-        'age': (185, 640),
-        'birthday': (200, 640),
-        'male': (98, 639),
-        'female': (76, 639),
-
-        # Statistical Data
-        'strength': (136, 604),
-        'damage bonus': (555, 200),
-        'constitution': (136, 586),
-        'dexterity': (136, 568),
-        'intelligence': (136, 550),
-        'power': (136, 532),
-        'charisma': (136, 514),
-        'hitpoints': (195, 482),
-        'willpower': (195, 464),
-        'sanity': (195, 446),
-        'breaking point': (195, 428),
-        'bond1': (512, 604),
-        'bond2': (512, 586),
-        'bond3': (512, 568),
-        'bond4': (512, 550),
-
-        # Applicable Skill Sets
-        'accounting': (200, 361),
-        'alertness': (200, 343),
-        'anthropology': (200, 325),
-        'archeology': (200, 307),
-        'art1value': (200, 289),
-        'art2value': (200, 281),
-        'art3value': (200, 274),
-        'art1label': (90, 289),
-        'art2label': (90, 281),
-        'art3label': (90, 274),
-        'artillery': (200, 253),
-        'athletics': (200, 235),
-        'bureaucracy': (200, 217),
-        'computer science': (200, 200),
-        'craft1label': (90, 185),
-        'craft1value': (200, 185),
-        'craft2label': (90, 177),
-        'craft2value': (200, 177),
-        'craft3label': (90, 169),
-        'craft3value': (200, 169),
-        'craft4label': (90, 161),
-        'craft4value': (200, 161),
-        'criminology': (200, 145),
-        'demolitions': (200, 127),
-        'disguise': (200, 109),
-        'dodge': (200, 91),
-        'drive': (200, 73),
-        'firearms': (200, 54),
-        'first aide': (361, 361),
-        'forensics': (361, 343),
-        'heavy machinery': (361, 325),
-        'heavy weapons': (361, 307),
-        'history': (361, 289),
-        'humint': (361, 270),
-        'law': (361, 253),
-        'medicine': (361, 235),
-        'melee weapons': (361, 217),
-        'military science': (361, 199),
-        'milsci label': (327, 199),
-        'navigate': (361, 163),
-        'occult': (361, 145),
-        'persuade': (361, 127),
-        'pharmacy': (361, 109),
-        'pilot1': (361, 91),
-        'pilot2': (361, 83),
-        'psychotherapy': (361, 54),
-        'ride': (521, 361),
-        'science1label': (442, 347),
-        'science1value': (521, 347),
-        'science2label': (442, 340),
-        'science2value': (521, 340),
-        'science3label': (442, 333),
-        'science3value': (521, 333),
-        'science4label': (442, 326),
-        'science4value': (521, 326),
-        'search': (521, 307),
-        'sigint': (521, 289),
-        'stealth': (521, 270),
-        'surgery': (521, 253),
-        'survival': (521, 235),
-        'swim': (521, 217),
-        'unarmed combat': (521, 200),
-        'unnatural': (521, 181),
-        'language1': (521, 145),
-        'language2': (521, 127),
-        'language3': (521, 109),
-        'skill1': (521, 91),
-        'skill2': (521, 73),
-        'skill3': (521, 54),
-    }
+    field_xy = FIELD_XY
 
     # Fields that also get a multiplier
     x5_stats = ['strength', 'constitution', 'dexterity', 'intelligence',
                 'power', 'charisma']
 
-    def __init__(self, filename='out.pdf', profession_list=None, count_each=None):
+    def __init__(self, filename='out.pdf', profession_list=None, count_each=None,
+                 links=True, background='jpeg'):
         self.filename = filename
-        self.c = canvas.Canvas(self.filename)
+        # Generator for the distinguishing features of the current page
+        self.rng = random
+        # (destination, rect) of every Table of Contents entry
+        self.toc_links = []
+        # (title, page index) of every bookmark and sheet side of every page
+        self.bookmarks = []
+        self.sheet_sides = {}
+        # In stamp mode ReportLab only draws the text, into an overlay that
+        # save_pdf() lays over a single shared copy of the vector sheet
+        self.links = links
+        self.overlay = None
+        # Show-text operators already encoded for this document, keyed by
+        # (font, size, string).  See draw_string()
+        self.text_ops = {}
+        if background == 'stamp':
+            self.overlay = io.BytesIO()
+        # Without a background only the text is drawn, for pages that get
+        # their sheet from elsewhere (see PdfStream.add_pages)
+        self.background = background
+        self.c = canvas.Canvas(self.overlay or self.filename)
         # Set US Letter in points
         self.c.setPageSize((612, 792))
         self.c.setAuthor('https://github.com/jimstorch/DGGen')
         self.c.setTitle('Delta Green Agent Roster')
         self.c.setSubject('Pre-generated characters for the Delta Green RPG')
         # Register Custom Fonts
-        pdfmetrics.registerFont(TTFont('Special Elite', 'data/SpecialElite.ttf'))
-        pdfmetrics.registerFont(TTFont('OCRA', 'data/OCRA.ttf'))
+        register_fonts()
+        self.features = load_table('DISTINGUISHING')
+        # The vector sheet is imported once as a form XObject per side and
+        # every page references it, instead of drawing the JPEG each time
+        self.sheet_forms = None
+        if background == 'vector':
+            self.sheet_forms = [makerl(self.c, xobj) for xobj in sheet_xobjects()]
         # If we're passed an optional list of professions
         # build a clickable Table of Contents on page 1
         if profession_list != None and count_each != None:
@@ -1212,17 +2589,22 @@ class Need2KnowPDF(object):
                 chapter = '{:.<40}'.format(
                     profession) + '{:.>4}'.format(pagenum)
                 self.c.drawString(150, top - count * 22, chapter)
-                self.c.linkAbsolute(profession, profession,
-                    (145, (top - 6) - (count * 22), 470, (top + 18) - (count * 22)))
+                self.toc_links.append((profession,
+                    (145, (top - 6) - (count * 22), 470, (top + 18) - (count * 22))))
                 count += 1
             chapter = '{:.<40}'.format('Blank Character Sheet Second Page'
                 ) + '{:.>4}'.format(pagenum + count_each)
             self.c.drawString(150, top - count * 22, chapter)
-            self.c.linkAbsolute('Back Page', 'Back Page',
-                (145, (top - 6) - (count * 22), 470, (top + 18) - (count * 22)))
+            self.toc_links.append(('Back Page',
+                (145, (top - 6) - (count * 22), 470, (top + 18) - (count * 22))))
+            # Merged and stamped rosters add the links once pages are known
+            if links and self.overlay is None:
+                for destination, rect in self.toc_links:
+                    self.c.linkAbsolute(destination, destination, rect)
             self.c.showPage()
 
     def bookmark(self, text):
+        self.bookmarks.append((text, self.c.getPageNumber() - 1))
         self.c.bookmarkPage(text)
         self.c.addOutlineEntry(text, text)
 
@@ -1230,50 +2612,1395 @@ class Need2KnowPDF(object):
         self.c.setFillColorRGB(r, g, b)
 
     def draw_string(self, x, y, text):
-        self.c.drawString(x, y, str(text))
+        # Same output as canvas.drawString(), but the encoding through the
+        # font subsetter is only done the first time a string is drawn in a
+        # given font and size.  Subset assignments belong to the document,
+        # so the cache lives and dies with this canvas.  Uses the canvas
+        # internals (_fontname, _fontsize, _code, _formatText) of the
+        # ReportLab pinned in reqirements.txt.
+        text = str(text)
+        key = (self.c._fontname, self.c._fontsize, text)
+        ops = self.text_ops.get(key)
+        if ops is None:
+            ops = self.c.beginText()._formatText(text) + ' T*'
+            self.text_ops[key] = ops
+        self.c._code.append('BT 1 0 0 1 %s Tm %s ET' % (fp_str(x, y), ops))
 
     def fill_field(self, field, value):
         x, y = self.field_xy[field]
-        self.c.drawString(x, y, str(value))
+        self.draw_string(x, y, value)
 
         if field in self.x5_stats:
-            self.draw_string(x + 36, y, str(value * 5))
+            self.draw_string(x + 36, y, value * 5)
             self.draw_string(x + 72, y, self.distinguishing(field, value))
 
     def distinguishing(self, field, value):
-        return choice(DISTINGUISHING.get((field, value), [""]))
+        return self.features.choice(field, value, self.rng)
+
+    def draw_background(self, side):
+        # side 0 is the front of the sheet, 1 the back
+        self.sheet_sides[self.c.getPageNumber() - 1] = side
+        if self.overlay is not None or self.background is None:
+            return
+        if self.sheet_forms:
+            self.c.doForm(self.sheet_forms[side])
+        else:
+            self.c.drawImage(SHEET_JPEGS[side], 0, 0, 612, 792)
 
     def add_page(self, character):
         # Add background.  ReportLab will cache it for repeat
         self.c.setFont(DEFAULT_FONT, 11)
         self.font_color(*TEXT_COLOR)
-        self.c.drawImage(
-            'data/Character Sheet NO BACKGROUND FRONT.jpg', 0, 0, 612, 792)
+        self.draw_background(0)
+        # Seeded agents get their own stream for the sheet as well
+        self.rng = random
+        if character.seed is not None:
+            self.rng = random.Random(character.seed + '/sheet')
 
-        for key in character.d:
-            self.fill_field(key, character.d[key])
+        for key, value in character.d.items():
+            self.fill_field(key, value)
 
         # Tell ReportLab we're done with current page
         self.c.showPage()
 
-    def save_pdf(self):
-        self.bookmark('Back Page')
-        self.c.drawImage(
-            'data/Character Sheet NO BACKGROUND BACK.jpg', 0, 0, 612, 792)
-        self.c.showPage()
+    def save_pdf(self, back_page=True):
+        if back_page:
+            self.bookmark('Back Page')
+            self.draw_background(1)
+            self.c.showPage()
         self.c.save()
+        if self.sheet_forms:
+            release_sheet_xobjects(self.c._doc)
+        if self.overlay is not None:
+            self.stamp()
+
+    def stamp(self):
+        # Copy the overlay pages into a PyPDF2 writer, put the sheet under
+        # them and rebuild the navigation ReportLab kept in its own catalog
+        reader = PdfFileReader(io.BytesIO(self.overlay.getvalue()))
+        writer = PdfFileWriter()
+        writer.addMetadata(reader.getDocumentInfo())
+        for n in range(reader.getNumPages()):
+            writer.addPage(reader.getPage(n))
+        stamp_sheet(writer, self.sheet_sides)
+        add_navigation(writer, self.bookmarks,
+                       self.toc_links if self.links else [])
+        write_pdf(writer, self.filename)
+
+
+def write_pdf(writer, filename):
+    # filename may also be a file-like object, as for canvas.Canvas
+    if hasattr(filename, 'write'):
+        writer.write(filename)
+    else:
+        with open(filename, 'wb') as f:
+            writer.write(f)
+
+
+def add_navigation(writer, bookmarks, toc_links):
+    # Outline entries and Table of Contents links for a PyPDF2 writer
+    destinations = {}
+    for title, pagenum in bookmarks:
+        destinations[title] = pagenum
+        writer.addBookmark(title, pagenum)
+    for destination, rect in toc_links:
+        writer.addLink(0, destinations[destination], rect)
+
+
+def stamp_sheet(writer, sheet_sides):
+    # Add each side of the vector sheet to writer once as a form XObject and
+    # draw it underneath the existing content of the pages in sheet_sides
+    sheet = PdfFileReader(io.BytesIO(sheet_data()))
+    forms = []
+    for side in range(sheet.getNumPages()):
+        page = sheet.getPage(side)
+        contents = page['/Contents']
+        if not isinstance(contents, ArrayObject):
+            contents = [contents]
+        form = DecodedStreamObject()
+        form.setData(b'\n'.join(c.getObject().getData() for c in contents))
+        # flateEncode() returns a fresh stream, so describe it afterwards
+        form = form.flateEncode()
+        form.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): page.mediaBox,
+            NameObject('/Resources'): page['/Resources'],
+        })
+        name = NameObject('/DGGenSheet%d' % side)
+        draw = DecodedStreamObject()
+        draw.setData(b'q ' + name.encode() + b' Do Q\n')
+        forms.append((name, writer._addObject(form),
+                      writer._addObject(draw)))
+
+    for pagenum, side in sheet_sides.items():
+        name, form, draw = forms[side]
+        page = writer.getPage(pagenum)
+        resources = page['/Resources']
+        if '/XObject' not in resources:
+            resources[NameObject('/XObject')] = DictionaryObject()
+        resources['/XObject'][name] = form
+        contents = page.raw_get('/Contents')
+        if isinstance(contents.getObject(), ArrayObject):
+            contents = contents.getObject()
+        else:
+            contents = [contents]
+        page[NameObject('/Contents')] = ArrayObject([draw] + list(contents))
+
+
+def fill_roster(pdf, profession_list, number, sex, bonus_package, text=False,
+                seed=None, names=None):
+    # Add number agents of each profession to pdf, in roster order
+    add_characters(pdf, generate(profession_list, number, sex, bonus_package,
+                                 seed, names), text)
+
+
+def add_characters(pdf, characters, text=False):
+    # Consume a stream of characters into pdf, bookmarking each profession
+    profession = None
+    for c in characters:
+        if c.d['profession'] != profession:
+            profession = c.d['profession']
+            pdf.bookmark(profession)
+        pdf.add_page(c)
+        if(text):
+            c.dump()
+
+
+def render_shard(profession_list, number, sex, bonus_package, text=False,
+                 background='jpeg', seed=None, names=None):
+    # Worker: render a slice of the roster, whole professions, to PDF bytes
+    # as render_chunk does
+    return render_chunk(profession_list, number, sex, bonus_package, 0,
+                        per_profession(number, sex) * len(profession_list),
+                        text, background, seed, names)
+
+
+def split_shards(profession_list, jobs):
+    # Contiguous slices so concatenating them keeps the serial page order
+    size, extra = divmod(len(profession_list), jobs)
+    shards = []
+    start = 0
+    for n in range(jobs):
+        end = start + size + (1 if n < extra else 0)
+        if end > start:
+            shards.append(profession_list[start:end])
+        start = end
+    return shards
+
+
+def merge_roster(filename, profession_list, number, sex, fragments, index=False,
+                 background='jpeg'):
+    # Stitch worker fragments between a front (TOC) and back page, then
+    # rebuild the outline and TOC links the serial canvas would have made.
+    # Written through a PdfStream, so the sheet and fonts every fragment
+    # carries are stored once however many workers rendered them.
+    each = per_profession(number, sex)
+    with open(filename, 'wb') as f:
+        stream = PdfStream(f)
+        for fragment in fragments:
+            stream.append(fragment)
+        front, toc_links = render_front(profession_list, each, index,
+                                        background)
+        back = (1 if index else 0) + len(stream.page_refs)
+        stream.finish(front, index,
+                      roster_bookmarks(profession_list, each, index, back),
+                      toc_links)
+
+
+def roster_bookmarks(profession_list, per_profession, index, back):
+    # (title, page index) of the outline of a full roster, as the serial
+    # canvas would have bookmarked it
+    first = 1 if index else 0
+    bookmarks = [('Table of Contents', 0)] if index else []
+    for count, profession in enumerate(profession_list):
+        bookmarks.append((profession, first + count * per_profession))
+    bookmarks.append(('Back Page', back))
+    return bookmarks
+
+
+def render_chunk(profession_list, number, sex, bonus_package, first, count,
+                 text=False, background='jpeg', seed=None, names=None):
+    # Worker: render agents first .. first+count-1 of the roster to PDF
+    # bytes, no TOC or back page.  Text dumps are captured so the parent
+    # can print them in roster order.
+    buf = io.BytesIO()
+    out = io.StringIO()
+    with binary_streams(), redirect_stdout(out):
+        p = Need2KnowPDF(buf, background=background)
+        add_characters(p, roster_slice(profession_list, number, sex,
+                                       bonus_package, seed, first, count,
+                                       names),
+                       text)
+        p.save_pdf(back_page=False)
+    return buf.getvalue(), out.getvalue()
+
+
+@contextmanager
+def binary_streams():
+    # Fragments are only read back by PdfStream, so ReportLab can leave
+    # their streams binary rather than ASCII85 encode the sheet image of
+    # every one of them
+    useA85 = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        yield
+    finally:
+        rl_config.useA85 = useA85
+
+
+class PdfStream(object):
+    # Incremental PDF writer.  Pages are copied out of finished fragments
+    # and written straight to disk, then an update section (page tree root,
+    # catalog, xref and trailer) is appended, so after every fragment the
+    # file is a complete PDF of the pages so far.  Only the page references
+    # and the digests of shared resources stay in memory.
+
+    def __init__(self, f):
+        self.f = f
+        self.f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.size = 1
+        # Offsets of the objects written since the last update
+        self.offsets = {0: None}
+        self.prev = None
+        self.root = self.reserve()
+        self.pages = self.reserve()
+        self.kids = []
+        self.page_refs = []
+        # Digest -> reference of every resource written so far, so the
+        # sheet image or form and its fonts are stored once, not per fragment
+        self.shared = {}
+        # q and Q streams around pages drawn under others
+        self.wrap = None
+        # Source (document, object number) -> our reference, see copy().
+        # Entries of a fragment are dropped once its pages are written;
+        # those of the page drawn under them are kept for the next one.
+        self.memo = {}
+
+    def reserve(self):
+        self.size += 1
+        return IndirectObject(self.size - 1, 0, self)
+
+    def write(self, obj, ref=None):
+        buf = io.BytesIO()
+        obj.writeToStream(buf, None)
+        return self.write_raw(buf.getvalue(), ref)
+
+    def write_raw(self, data, ref=None):
+        if ref is None:
+            ref = self.reserve()
+        self.offsets[ref.idnum] = self.f.tell()
+        self.f.write(b'%d 0 obj\n' % ref.idnum)
+        self.f.write(data)
+        self.f.write(b'\nendobj\n')
+        return ref
+
+    def store(self, obj):
+        buf = io.BytesIO()
+        obj.writeToStream(buf, None)
+        data = buf.getvalue()
+        digest = hashlib.sha1(data).digest()
+        if digest not in self.shared:
+            self.shared[digest] = self.write_raw(data)
+        return self.shared[digest]
+
+    def copy(self, obj, memo, shared=True):
+        # obj with every object it references written to this file.  memo
+        # maps the source documents' object numbers to ours.  Content
+        # streams are unique to their page and skip the digest.
+        if isinstance(obj, IndirectObject):
+            key = (id(obj.pdf), obj.idnum)
+            if key not in memo:
+                value = self.copy(obj.getObject(), memo)
+                memo[key] = (self.store(value) if shared
+                             else self.write(value))
+            return memo[key]
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(x, memo, shared) for x in obj)
+        if isinstance(obj, DictionaryObject):
+            if isinstance(obj, StreamObject):
+                new = obj.__class__()
+                new._data = obj._data
+            else:
+                new = DictionaryObject()
+            for key, value in obj.items():
+                if key != '/Length':
+                    new[NameObject(key)] = self.copy(value, memo)
+            return new
+        return obj
+
+    def add_pages(self, reader, numbers=None, annots=None, under=None):
+        # Copy pages of a PyPDF2 reader under a new intermediate /Pages node
+        # and return the references of the new pages.  annots maps a page
+        # number to annotation dictionaries to put on it.  under is a page
+        # of another reader, such as a bare sheet, to draw beneath each one.
+        if numbers is None:
+            numbers = range(reader.getNumPages())
+        node = self.reserve()
+        memo = self.memo
+        kids = ArrayObject()
+        for n in numbers:
+            page = reader.getPage(n)
+            new = DictionaryObject()
+            for key, value in page.items():
+                if key not in ('/Parent', '/Annots'):
+                    new[NameObject(key)] = self.copy(value, memo,
+                                                     key != '/Contents')
+            if under is not None:
+                self.draw_under(new, page, under, memo)
+            new[NameObject('/Parent')] = node
+            if annots and n in annots:
+                new[NameObject('/Annots')] = ArrayObject(annots[n])
+            kids.append(self.write(new))
+        for key in [key for key in memo if key[0] == id(reader)]:
+            del memo[key]
+        self.write(DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Parent'): self.pages,
+            NameObject('/Kids'): kids,
+            NameObject('/Count'): NumberObject(len(kids)),
+        }), node)
+        return node, list(kids)
+
+    def draw_under(self, new, page, under, memo):
+        # Put the content of under beneath new, the copy of page, and give
+        # new the resources of both
+        resources = DictionaryObject()
+        for source in (under['/Resources'], page['/Resources']):
+            for key, value in source.items():
+                value = value.getObject()
+                if key in resources and isinstance(value, DictionaryObject):
+                    merged = DictionaryObject(resources[key])
+                    merged.update(value)
+                    value = merged
+                resources[NameObject(key)] = value
+        new[NameObject('/Resources')] = self.copy(resources, memo)
+        if self.wrap is None:
+            # under is drawn inside q ... Q so the page starts from a
+            # clean graphics state
+            push = DecodedStreamObject()
+            push.setData(b'q\n')
+            pop = DecodedStreamObject()
+            pop.setData(b'\nQ\n')
+            self.wrap = (self.write(push), self.write(pop))
+        sheet = self.copy(under.raw_get('/Contents'), memo)
+        contents = new.raw_get('/Contents')
+        new[NameObject('/Contents')] = ArrayObject(
+            [self.wrap[0]] +
+            list(sheet if isinstance(sheet, ArrayObject) else [sheet]) +
+            [self.wrap[1]] +
+            list(contents if isinstance(contents, ArrayObject) else [contents]))
+
+    def append(self, fragment, under=None):
+        # Add every page of a PDF fragment and make it durable
+        node, refs = self.add_pages(PdfFileReader(io.BytesIO(fragment)),
+                                    under=under)
+        self.kids.append(node)
+        self.page_refs.extend(refs)
+        self.update()
+
+    def update(self, kids=None, count=None, outlines=None, info=None):
+        # Append the page tree root, catalog, xref section and trailer
+        self.write(DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(kids or self.kids),
+            NameObject('/Count'): NumberObject(count or len(self.page_refs)),
+        }), self.pages)
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): self.pages,
+        })
+        if outlines is not None:
+            catalog[NameObject('/Outlines')] = outlines
+            catalog[NameObject('/PageMode')] = NameObject('/UseOutlines')
+        self.write(catalog, self.root)
+
+        xref = self.f.tell()
+        self.f.write(b'xref\n')
+        numbers = sorted(self.offsets)
+        start = 0
+        while start < len(numbers):
+            end = start + 1
+            while (end < len(numbers) and
+                   numbers[end] == numbers[end - 1] + 1):
+                end += 1
+            self.f.write(b'%d %d\n' % (numbers[start], end - start))
+            for number in numbers[start:end]:
+                if number == 0:
+                    self.f.write(b'0000000000 65535 f \n')
+                else:
+                    self.f.write(b'%010d 00000 n \n' % self.offsets[number])
+            start = end
+        trailer = DictionaryObject({
+            NameObject('/Size'): NumberObject(self.size),
+            NameObject('/Root'): self.root,
+        })
+        if self.prev is not None:
+            trailer[NameObject('/Prev')] = NumberObject(self.prev)
+        if info is not None:
+            trailer[NameObject('/Info')] = info
+        self.f.write(b'trailer\n')
+        trailer.writeToStream(self.f, None)
+        self.f.write(b'\nstartxref\n%d\n%%%%EOF\n' % xref)
+        self.f.flush()
+        self.prev = xref
+        self.offsets = {}
+
+    def finish(self, front, index, bookmarks, toc_links):
+        # Add the Table of Contents and back page of front, a Need2KnowPDF
+        # rendered to bytes, then the outline and TOC links of the roster
+        reader = PdfFileReader(io.BytesIO(front))
+        back_node, back_refs = self.add_pages(reader,
+                                              [reader.getNumPages() - 1])
+        kids = self.kids + [back_node]
+        refs = self.page_refs + back_refs
+        if index:
+            # No TOC entry points at the TOC page itself, so it can go last
+            pages = dict(bookmarks)
+            links = []
+            for destination, rect in toc_links:
+                links.append(DictionaryObject({
+                    NameObject('/Type'): NameObject('/Annot'),
+                    NameObject('/Subtype'): NameObject('/Link'),
+                    NameObject('/Rect'): ArrayObject(
+                        NumberObject(n) for n in rect),
+                    NameObject('/Border'): ArrayObject(
+                        [NumberObject(0)] * 3),
+                    NameObject('/Dest'): ArrayObject([
+                        refs[pages[destination] - 1], NameObject('/Fit')]),
+                }))
+            front_node, front_refs = self.add_pages(reader, [0], {0: links})
+            kids.insert(0, front_node)
+            refs = front_refs + refs
+
+        outlines = self.reserve()
+        items = [self.reserve() for bookmark in bookmarks]
+        for n, (title, pagenum) in enumerate(bookmarks):
+            item = DictionaryObject({
+                NameObject('/Title'): TextStringObject(title),
+                NameObject('/Parent'): outlines,
+                NameObject('/Dest'): ArrayObject([refs[pagenum],
+                                                  NameObject('/Fit')]),
+            })
+            if n > 0:
+                item[NameObject('/Prev')] = items[n - 1]
+            if n < len(items) - 1:
+                item[NameObject('/Next')] = items[n + 1]
+            self.write(item, items[n])
+        self.write(DictionaryObject({
+            NameObject('/Type'): NameObject('/Outlines'),
+            NameObject('/First'): items[0],
+            NameObject('/Last'): items[-1],
+            NameObject('/Count'): NumberObject(len(items)),
+        }), outlines)
+        info = self.copy(reader.trailer.raw_get('/Info'), {})
+        self.update(kids, len(refs), outlines, info)
+
+
+def roster_blocks(profession_list, number, sex, size):
+    # (first, count) chunks of at most size agents.  Chunks never straddle
+    # two professions, so each one only depends on its own agents.
+    each = per_profession(number, sex)
+    blocks = []
+    for n in range(len(profession_list)):
+        for start in range(0, each, size):
+            blocks.append((n * each + start, min(size, each - start)))
+    return blocks
+
+
+def dump_agents(profession_list, number, sex, bonus_package, seed, first,
+                count, names=None):
+    # The text dumps render_chunk() would have captured, for cached chunks
+    out = io.StringIO()
+    with redirect_stdout(out):
+        for c in roster_slice(profession_list, number, sex, bonus_package,
+                              seed, first, count, names):
+            c.dump()
+    return out.getvalue()
+
+
+def process_pool(jobs, **kwargs):
+    # A ProcessPoolExecutor of jobs workers.  concurrent.futures.process
+    # pulls in multiprocessing, so only runs that start workers import it.
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=jobs, **kwargs)
+
+
+def render_chunks(profession_list, number, sex, bonus_package, chunks,
+                  jobs=1, text=False, background='jpeg', seed=None,
+                  cache=None, names=None):
+    # Yield (pdf bytes, captured text) of every (first, count) chunk of the
+    # roster, in order.  With a cache, chunks are text only: ones found in
+    # the cache are read back rather than rendered and rendered ones are
+    # added to it.  With jobs > 1 at most two chunks per worker are in
+    # flight, so finished chunks never pile up waiting to be written.
+    if cache is not None:
+        background = None
+    pool = process_pool(jobs) if jobs > 1 else None
+    pending = deque()
+
+    def result(item):
+        # value is a Future until the pool has rendered it
+        key, value = item
+        if not isinstance(value, tuple):
+            value = value.result()
+        if key is not None:
+            cache.put(key, value[0])
+        return value
+
+    try:
+        for first, count in chunks:
+            key = fragment = None
+            if cache is not None:
+                key = cache.key(roster_agents(profession_list, number, sex,
+                                              first, count),
+                                bonus_package, seed, names)
+                fragment = cache.get(key)
+            if fragment is not None:
+                dump = ''
+                if text:
+                    dump = dump_agents(profession_list, number, sex,
+                                       bonus_package, seed, first, count,
+                                       names)
+                pending.append((None, (fragment, dump)))
+            else:
+                args = (profession_list, number, sex, bonus_package, first,
+                        count, text, background, seed, names)
+                if pool:
+                    pending.append((key, pool.submit(render_chunk, *args)))
+                else:
+                    pending.append((key, render_chunk(*args)))
+            while len(pending) > (2 * jobs if pool else 0):
+                yield result(pending.popleft())
+        while pending:
+            yield result(pending.popleft())
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+def stream_roster(filename, profession_list, number, sex, bonus_package,
+                  chunk, jobs=1, text=False, index=False, background='jpeg',
+                  seed=None, cache=None, names=None):
+    # Write the roster through a PdfStream, so memory stays bounded and an
+    # interrupted run leaves the chunks done so far (see recover_pdf).
+    # Chunks from a PageCache are text only and get the sheet drawn under.
+    each = per_profession(number, sex)
+    under = None
+    if cache is not None:
+        under = PdfFileReader(io.BytesIO(render_sheet(background))).getPage(0)
+    with open(filename, 'wb') as f:
+        stream = PdfStream(f)
+        for fragment, dump in render_chunks(
+                profession_list, number, sex, bonus_package,
+                roster_blocks(profession_list, number, sex, chunk), jobs, text,
+                background, seed, cache, names):
+            print(dump, end='')
+            stream.append(fragment, under)
+
+        front, toc_links = render_front(profession_list, each, index,
+                                        background)
+        back = (1 if index else 0) + len(stream.page_refs)
+        stream.finish(front, index,
+                      roster_bookmarks(profession_list, each, index, back),
+                      toc_links)
+
+
+def render_front(profession_list, per_profession, index=False,
+                 background='jpeg'):
+    # The Table of Contents (with index) and back page PdfStream.finish()
+    # takes, as PDF bytes and the rectangles of the TOC entries
+    buf = io.BytesIO()
+    with binary_streams():
+        front = Need2KnowPDF(buf, profession_list,
+                             per_profession if index else None, links=False,
+                             background=background)
+        front.save_pdf()
+    return buf.getvalue(), front.toc_links
+
+
+def render_sheet(background):
+    # A one page PDF with nothing but the front of the sheet on it, to draw
+    # under text-only pages
+    buf = io.BytesIO()
+    with binary_streams():
+        p = Need2KnowPDF(buf, background=background)
+        p.draw_background(0)
+        p.c.showPage()
+        p.save_pdf(back_page=False)
+    return buf.getvalue()
+
+
+def render_fingerprint():
+    # Digest of everything the text of a seeded page depends on besides its
+    # agent: this module, the data tables, the fonts and the PDF libraries
+    # that encode them.  The sheet is drawn under cached pages afresh.
+    digest = hashlib.sha1()
+    files = ([os.path.abspath(__file__)] +
+             [data_path(name) for name in sorted(FONT_FILES.values())] +
+             [data_path(name) for name in sorted(TABLE_FILES.values())] +
+             [data_path('distinguishing-features.csv')])
+    for filename in files:
+        with open(filename, 'rb') as f:
+            digest.update(hashlib.sha1(f.read()).digest())
+    digest.update(repr((reportlab.Version, PyPDF2.__version__,
+                        PdfReader is not None)).encode())
+    return digest.digest()
+
+
+class PageCache(object):
+    # Content-addressed store of the text-only pages of seeded rosters, in
+    # chunks.  The text of a seeded page is a pure function of its agent and
+    # render_fingerprint(), so a chunk is filed under the digest of both and
+    # reused by any later run that needs the same pages, whatever else is
+    # on its roster and whichever background it uses.
+
+    def __init__(self, directory=PAGE_CACHE_DIR):
+        self.directory = directory
+        self.fingerprint = render_fingerprint()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, agents, bonus_package, seed, names=None):
+        # agents are the (profession, gender, index) of roster_agents()
+        digest = hashlib.sha1(self.fingerprint)
+        digest.update(repr((seed, bonus_package, list(agents),
+                            names and names.key)).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pdf')
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, data)
+
+
+def recover_pdf(filename):
+    # Cut an interrupted streamed roster back to its last complete update,
+    # leaving a valid PDF of every chunk that was finished.  Returns the
+    # number of bytes dropped.  The file is searched through a memory map,
+    # so a large roster is never read into memory.
+    with open(filename, 'r+b') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = -1
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b'%%EOF\n')
+        if end < 0:
+            raise ValueError('%s has no complete update' % filename)
+        end += len(b'%%EOF\n')
+        f.truncate(end)
+    return size - end
+
+
+def split_spec(value):
+    # argparse type of --split-by: 'profession' or 'count:N'
+    if value == 'profession':
+        return value
+    if value.startswith('count:') and value[6:].isdigit() and int(value[6:]):
+        return value
+    raise argparse.ArgumentTypeError("expected 'profession' or 'count:N'")
+
+
+def split_roster(profession_list, number, sex, split_by):
+    # (name, first, count) of every file of a split roster.  Seeded parts
+    # hold exactly the agents of the same slice of the single-file roster.
+    each = per_profession(number, sex)
+    if split_by == 'profession':
+        return [(profession, n * each, each)
+                for n, profession in enumerate(profession_list)]
+    size = int(split_by[6:])
+    total = each * len(profession_list)
+    width = len(str((total - 1) // size + 1))
+    return [('%0*d' % (width, n + 1), first, min(size, total - first))
+            for n, first in enumerate(range(0, total, size))]
+
+
+def part_filename(filename, name):
+    # DeltaGreenPregen.pdf -> DeltaGreenPregen-Business_Executive.pdf
+    root, ext = os.path.splitext(filename)
+    return '%s-%s%s' % (root, name.replace(' ', '_'), ext or '.pdf')
+
+
+def render_part(filename, profession_list, number, sex, bonus_package, first,
+                count, text=False, index=False, background='jpeg', seed=None,
+                names=None):
+    # Worker: write agents first .. first+count-1 of the roster to their own
+    # file, with its own outline and back page.  A Table of Contents is only
+    # possible when the file holds whole professions.  Returns the file's
+    # manifest entry and the captured text dumps.
+    each = per_profession(number, sex)
+    professions = profession_list[first // each:
+                                  (first + count - 1) // each + 1]
+    toc = index and first % each == 0 and count % each == 0
+    out = io.StringIO()
+    with redirect_stdout(out):
+        p = Need2KnowPDF(filename, professions, each if toc else None,
+                         background=background)
+        add_characters(p, roster_slice(profession_list, number, sex,
+                                       bonus_package, seed, first, count,
+                                       names),
+                       text)
+        p.save_pdf()
+    entry = {
+        'file': filename,
+        'professions': professions,
+        'first': first,
+        'agents': count,
+        'pages': count + (2 if toc else 1),
+        'bookmarks': [[title, page + 1] for title, page in p.bookmarks],
+    }
+    return entry, out.getvalue()
+
+
+def write_split(filename, profession_list, number, sex, bonus_package,
+                split_by, jobs=1, text=False, index=False, background='jpeg',
+                seed=None, manifest=None, names=None):
+    # Write the roster as one PDF per split_roster() part, jobs files at a
+    # time, and optionally a JSON manifest of the files
+    parts = split_roster(profession_list, number, sex, split_by)
+    columns = ([part_filename(filename, name)
+                for name, first, count in parts],
+               [profession_list] * len(parts), [number] * len(parts),
+               [sex] * len(parts), [bonus_package] * len(parts),
+               [first for name, first, count in parts],
+               [count for name, first, count in parts],
+               [text] * len(parts), [index] * len(parts),
+               [background] * len(parts), [seed] * len(parts),
+               [names] * len(parts))
+    if jobs > 1:
+        with process_pool(jobs) as pool:
+            results = list(pool.map(render_part, *columns))
+    else:
+        results = list(map(render_part, *columns))
+    for entry, dump in results:
+        print(dump, end='')
+    if manifest:
+        with open(manifest, 'w') as f:
+            json.dump({
+                'split_by': split_by,
+                'sex': sex,
+                'bonus_package': bonus_package,
+                'background': background,
+                'seed': seed,
+                'files': [entry for entry, dump in results],
+            }, f, indent=2)
+            f.write('\n')
+    return [entry for entry, dump in results]
+
+
+def write_jsonl(filename, characters):
+    # One JSON object per agent, straight from the character dictionary
+    with open(filename, 'w', buffering=EXPORT_BUFFER) as f:
+        for c in characters:
+            f.write(json.dumps(dict(c.d.items())))
+            f.write('\n')
+
+
+def write_csv(filename, characters):
+    # One row per agent, one column per sheet field
+    with open(filename, 'w', buffering=EXPORT_BUFFER, newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(Need2KnowPDF.field_xy))
+        writer.writeheader()
+        for c in characters:
+            writer.writerow(c.d)
+
+
+def columnar_schema():
+    # Fixed schema over every sheet field, blank fields are null
+    pyarrow = importlib.import_module('pyarrow')
+    return pyarrow.schema([
+        (field, pyarrow.string() if is_text_field(field) else pyarrow.int16())
+        for field in Need2KnowPDF.field_xy])
+
+
+def write_columnar(filename, characters, row_group=ROW_GROUP):
+    # Parquet file written one row group at a time so memory stays bounded
+    pyarrow = optional_import('pyarrow')
+    if pyarrow is None:
+        raise ImportError('pyarrow is required for the columnar format')
+    importlib.import_module('pyarrow.parquet')
+    schema = columnar_schema()
+    fields = schema.names
+    with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+        columns = [[] for field in fields]
+        rows = 0
+        for c in characters:
+            for field, column in zip(fields, columns):
+                column.append(c.d.get(field))
+            rows += 1
+            if rows == row_group:
+                writer.write_table(pyarrow.table(columns, schema=schema))
+                columns = [[] for field in fields]
+                rows = 0
+        if rows:
+            writer.write_table(pyarrow.table(columns, schema=schema))
+
+
+EXPORTERS = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+    'columnar': write_columnar,
+}
+
+
+def match_profession(name):
+    # First profession containing name, case-insensitively, as in -p
+    for prof in PROFESSIONS:
+        if name.upper() in prof.upper():
+            return prof
+    return None
+
+
+# Largest party the service renders in one request
+MAX_PARTY = 24
+
+
+def warm_up(background='jpeg'):
+    # Load everything a render touches so requests only pay for the agents
+    for name in TABLE_FILES:
+        picker(name)
+    load_table('DISTINGUISHING')
+    register_fonts()
+    if background == 'vector':
+        sheet_xobjects()
+    elif background == 'stamp':
+        sheet_data()
+    else:
+        render_sheet(background)
+
+
+def party_agents(profession_list, sex, bonus_package, seed=None):
+    # One agent of sex 'm' or 'f' per entry of profession_list, in order.
+    # Repeats of a profession are numbered within it as on a roster, so
+    # they are distinct agents: the third Nurse of a seeded party is agent
+    # #2 of -p Nurse with the same seed and sex.
+    gender = 'male' if sex == 'm' else 'female'
+    counts = {}
+    for profession in profession_list:
+        index = counts.get(profession, 0)
+        counts[profession] = index + 1
+        yield Need2KnowCharacter(gender=gender, profession=profession,
+                                 bonus_package=bonus_package,
+                                 seed=agent_seed(seed, profession, index))
+
+
+def render_party(profession_list, sex, bonus_package, fmt='pdf',
+                 background='jpeg', seed=None):
+    # One agent per entry of profession_list, as (content type, body)
+    characters = party_agents(profession_list, sex, bonus_package, seed)
+    if fmt == 'json':
+        body = json.dumps([dict(c.d.items()) for c in characters]).encode('utf-8')
+        return 'application/json', body
+    # Binary streams pass the sheet JPEG through as it is; ASCII85 encoding
+    # it took over a second per request
+    buf = io.BytesIO()
+    with binary_streams():
+        p = Need2KnowPDF(buf, background=background)
+        add_characters(p, characters)
+        p.save_pdf()
+    return 'application/pdf', buf.getvalue()
+
+
+class GeneratorHandler(object):
+    # GET /agent?profession=&sex=m|f&bonus=&count=&format=pdf|json&seed=
+    # Agents are rendered by the server's warm worker pool.  Mixed into
+    # http.server's BaseHTTPRequestHandler by serve(), which is only
+    # imported when serving.
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/agent':
+            self.send_error(404)
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            count = int(query.get('count', 1))
+        except ValueError:
+            self.send_error(400, 'count must be an integer')
+            return
+        fmt = query.get('format', 'pdf')
+        seed = query.get('seed')
+        sex = query.get('sex')
+        if sex is None:
+            # Seeded requests take their default sex from the seed, as the
+            # CLI does
+            rng = random if seed is None else random.Random(seed)
+            sex = rng.choice(['m', 'f'])
+        if not 1 <= count <= MAX_PARTY or fmt not in ('pdf', 'json') or \
+                sex not in ('m', 'f'):
+            self.send_error(400, 'bad count, format or sex')
+            return
+        if 'profession' in query:
+            profession = match_profession(query['profession'])
+            if profession is None:
+                self.send_error(400, 'unknown profession')
+                return
+            profession_list = [profession] * count
+        else:
+            rng = random if seed is None else random.Random(seed)
+            profession_list = [rng.choice(PROFESSIONS) for x in range(count)]
+
+        future = self.server.pool.submit(
+            render_party, profession_list, sex, query.get('bonus', 'random'),
+            fmt, self.server.background, seed)
+        try:
+            content_type, body = future.result()
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no host
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+def serve(address, jobs=1, background='jpeg'):
+    # Serve agents on host:port, or on a Unix socket if address is a path
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import socketserver
+
+    class Handler(GeneratorHandler, BaseHTTPRequestHandler):
+        pass
+
+    class UnixHTTPServer(socketserver.ThreadingMixIn,
+                         socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if '/' in address:
+        if os.path.exists(address):
+            os.remove(address)
+        server = UnixHTTPServer(address, Handler)
+    else:
+        host, port = address.rsplit(':', 1)
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.background = background
+    warm_up(background)
+    with process_pool(jobs, initializer=warm_up,
+                             initargs=(background,)) as pool:
+        server.pool = pool
+        # Start every worker now rather than on the first requests
+        for future in [pool.submit(warm_up, background) for x in range(jobs)]:
+            future.result()
+        print('serving on', address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def roll_agents(profession_list, number, sex, bonus_package, seed, first,
+                count, names=None):
+    # Worker: agents first .. first+count-1 of the roster, as a list
+    return list(roster_slice(profession_list, number, sex, bonus_package,
+                             seed, first, count, names))
+
+
+class ChunkSink(object):
+    # Write-only file for a PdfStream whose output is handed on in pieces
+    # rather than kept: drain() returns what was written since last time
+
+    def __init__(self):
+        self.pieces = []
+        self.offset = 0
+
+    def write(self, data):
+        self.pieces.append(data)
+        self.offset += len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
+
+
+class AsyncRenderer(object):
+    # asyncio facade over a warm process pool that every caller shares.
+    # Nothing CPU bound runs on the event loop.  At most concurrency jobs
+    # are queued on the pool at once and further callers wait for a slot;
+    # each call keeps at most jobs chunks ahead of its consumer, and
+    # cancelling a call, or closing its iterator, cancels its queued jobs.
+    #
+    #     async with AsyncRenderer(jobs=4) as renderer:
+    #         pdf = await renderer.render_roster(['Nurse'], 10, seed='x')
+    #         async for agent in renderer.agents(PROFESSIONS, 5):
+    #             ...
+    #         async for data in renderer.pdf_chunks(PROFESSIONS, 40):
+    #             await response.write(data)
+
+    def __init__(self, jobs=None, concurrency=None, background='jpeg',
+                 chunk=CACHE_BLOCK):
+        # Imported here rather than with the module, whose every CLI run
+        # and pool worker would pay for it
+        self.asyncio = importlib.import_module('asyncio')
+        self.jobs = jobs or os.cpu_count() or 1
+        self.background = background
+        self.chunk = chunk
+        self.pool = process_pool(self.jobs, initializer=warm_up,
+                                 initargs=(background,))
+        self.slots = self.asyncio.Semaphore(concurrency or 2 * self.jobs)
+        self.sheet = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.pool.shutdown(cancel_futures=True))
+
+    async def run(self, fn, *args):
+        # fn(*args) on the pool, once a slot is free
+        async with self.slots:
+            return await self.asyncio.get_running_loop().run_in_executor(
+                self.pool, fn, *args)
+
+    async def ahead(self, calls):
+        # Results of (fn, *args) calls in order, with up to jobs of them
+        # running ahead of the consumer
+        pending = deque()
+        try:
+            for call in calls:
+                pending.append(self.asyncio.ensure_future(self.run(*call)))
+                if len(pending) >= self.jobs:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def agents(self, profession_list=PROFESSIONS, number=1, sex='b',
+                     bonus_package='random', seed=None, batch=256,
+                     names=None):
+        # Need2KnowCharacter objects in roster order, rolled batch at a time
+        calls = ((roll_agents, profession_list, number, sex, bonus_package,
+                  seed, first, count, names)
+                 for first, count in roster_blocks(profession_list, number,
+                                                   sex, batch))
+        async for agents in self.ahead(calls):
+            for agent in agents:
+                yield agent
+
+    async def pdf_chunks(self, profession_list=PROFESSIONS, number=1,
+                         sex='b', bonus_package='random', seed=None,
+                         index=False, names=None):
+        # The roster PDF as it is produced, one piece per rendered chunk.
+        # Chunks are rendered text only and assembled by a PdfStream in a
+        # thread, over one copy of the sheet, which keeps that thread's
+        # share of the interpreter small.
+        loop = self.asyncio.get_running_loop()
+        if self.sheet is None:
+            self.sheet = await self.run(render_sheet, self.background)
+        under = PdfFileReader(io.BytesIO(self.sheet)).getPage(0)
+        sink = ChunkSink()
+        stream = PdfStream(sink)
+        calls = ((render_chunk, profession_list, number, sex, bonus_package,
+                  first, count, False, None, seed, names)
+                 for first, count in roster_blocks(profession_list, number,
+                                                   sex, self.chunk))
+        async for fragment, dump in self.ahead(calls):
+            await loop.run_in_executor(None, stream.append, fragment, under)
+            yield sink.drain()
+        each = per_profession(number, sex)
+        front, toc_links = await self.run(render_front, profession_list,
+                                          each, index, self.background)
+        bookmarks = roster_bookmarks(profession_list, each, index,
+                                     (1 if index else 0) +
+                                     len(stream.page_refs))
+        await loop.run_in_executor(None, stream.finish, front, index,
+                                   bookmarks, toc_links)
+        yield sink.drain()
+
+    async def render_roster(self, profession_list=PROFESSIONS, number=1,
+                            sex='b', bonus_package='random', seed=None,
+                            index=False, names=None):
+        # The whole roster PDF as bytes
+        pieces = []
+        async for data in self.pdf_chunks(profession_list, number, sex,
+                                          bonus_package, seed, index, names):
+            pieces.append(data)
+        return b''.join(pieces)
+
+
+class Timings(object):
+    # Wall time and call count per instrumented section, see instrument()
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+
+    def wrap(self, name, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.totals[name] = (self.totals.get(name, 0.0) +
+                                     time.perf_counter() - start)
+                self.calls[name] = self.calls.get(name, 0) + 1
+        return timed
+
+    def report(self, wall, out=sys.stdout):
+        print('%-20s %8s %10s %10s %6s' % (
+            'section', 'calls', 'total s', 'per call ms', '%'), file=out)
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            total = self.totals[name]
+            print('%-20s %8d %10.3f %10.3f %6.1f' % (
+                name, self.calls[name], total,
+                total / self.calls[name] * 1e3, total / wall * 100), file=out)
+        print('%-20s %8s %10.3f' % ('wall', '', wall), file=out)
+
+
+def instrument(timings):
+    # Wrap the hot paths of this process in place for --stats, so normal
+    # runs pay nothing.  fill_field, background and showPage are all part
+    # of add_page; workers started by --jobs are not instrumented.
+    global register_fonts, sheet_xobjects, load_lines
+    register_fonts = timings.wrap('font setup', register_fonts)
+    sheet_xobjects = timings.wrap('sheet import', sheet_xobjects)
+    load_lines = timings.wrap('data tables', load_lines)
+    Need2KnowCharacter.__init__ = timings.wrap(
+        'character rolling', Need2KnowCharacter.__init__)
+    Need2KnowPDF.add_page = timings.wrap('add_page', Need2KnowPDF.add_page)
+    Need2KnowPDF.fill_field = timings.wrap('fill_field', Need2KnowPDF.fill_field)
+    Need2KnowPDF.draw_background = timings.wrap(
+        'background', Need2KnowPDF.draw_background)
+    Need2KnowPDF.stamp = timings.wrap('stamp', Need2KnowPDF.stamp)
+    canvas.Canvas.showPage = timings.wrap('showPage', canvas.Canvas.showPage)
+    canvas.Canvas.save = timings.wrap('save', canvas.Canvas.save)
+
+
+def write_party(args, filename, profession_list, sex, bonus_package,
+                names=None):
+    # --party: one file with a party built to the --need constraints; a
+    # bonus package given with -b is the only one the builder may use
+    started = time.perf_counter()
+    party, unmet = build_party(args.party, args.need or [], profession_list,
+                               [bonus_package] if args.bonus else None, sex,
+                               args.seed, args.budget, names)
+    print('party of %d built in %.2f s' % (len(party),
+                                           time.perf_counter() - started))
+    for need, reason in unmet:
+        print('unmet: %s (%s)' % (format_need(need), reason))
+    if(args.format != 'pdf'):
+        EXPORTERS[args.format](filename, party)
+    else:
+        p = Need2KnowPDF(filename, background=args.background)
+        add_characters(p, party, args.text)
+        p.save_pdf()
+    return unmet
+
+
+def write_query(args, filename, profession_list, number, sex, bonus_package,
+                names=None):
+    # --where: roll the roster into a Roster and write only the agents
+    # meeting every threshold
+    started = time.perf_counter()
+    roster = Roster(generate(profession_list, number, sex, bonus_package,
+                             args.seed, names))
+    roster.freeze()
+    rolled = time.perf_counter()
+    found = roster.query(args.where)
+    print('%d of %d agents match, rolled in %.2f s, queried in %.1f ms' % (
+        len(found), len(roster), rolled - started,
+        (time.perf_counter() - rolled) * 1e3))
+    if(args.format != 'pdf'):
+        EXPORTERS[args.format](filename, roster.agents(found))
+    else:
+        p = Need2KnowPDF(filename, background=args.background)
+        add_characters(p, roster.agents(found), args.text)
+        p.save_pdf()
+    return found
+
+
+def write_roster(args, filename, profession_list, number, sex, bonus_package):
+    # Produce the output the command line asked for
+    total = None
+    if(args.index):
+        total = per_profession(number, sex)
+    # Unique names follow the seed, or a random key shared by all workers
+    names = None
+    if(args.unique_names):
+        names = UniqueNames(args.seed)
+
+    if(args.party):
+        write_party(args, filename, profession_list, sex, bonus_package,
+                    names)
+    elif(args.where):
+        write_query(args, filename, profession_list, number, sex,
+                    bonus_package, names)
+    elif(args.distribution):
+        write_distributions(filename, profession_list,
+                            [bonus_package] if args.bonus else BONUS_PACKAGES,
+                            args.format)
+    elif(args.format != 'pdf'):
+        EXPORTERS[args.format](filename, generate(profession_list, number, sex,
+                                                  bonus_package, args.seed,
+                                                  names))
+    elif(args.split_by):
+        write_split(filename, profession_list, number, sex, bonus_package,
+                    args.split_by, args.jobs, args.text, args.index,
+                    args.background, args.seed, args.manifest, names)
+    elif(args.cache):
+        # Chunks are cached whole, so runs reuse each other's pages when
+        # they use the same --stream size
+        cache = PageCache(args.cache)
+        stream_roster(filename, profession_list, number, sex, bonus_package,
+                      args.stream or CACHE_BLOCK, args.jobs, args.text,
+                      args.index, args.background, args.seed, cache, names)
+        print('page cache: %d of %d chunks reused' % (
+            cache.hits, cache.hits + cache.misses))
+    elif(args.stream):
+        stream_roster(filename, profession_list, number, sex, bonus_package,
+                      args.stream, args.jobs, args.text, args.index,
+                      args.background, args.seed, names=names)
+    elif(args.jobs > 1):
+        shards = split_shards(profession_list, args.jobs)
+        with process_pool(len(shards)) as pool:
+            results = list(pool.map(render_shard, shards,
+                [number] * len(shards), [sex] * len(shards),
+                [bonus_package] * len(shards), [args.text] * len(shards),
+                [args.background] * len(shards), [args.seed] * len(shards),
+                [names] * len(shards)))
+        for fragment, text in results:
+            print(text, end='')
+        merge_roster(filename, profession_list, number, sex,
+                     [fragment for fragment, text in results], args.index,
+                     args.background)
+    else:
+        p = Need2KnowPDF(filename, profession_list, total,
+                         background=args.background)
+        fill_roster(p, profession_list, number, sex, bonus_package, args.text,
+                    args.seed, names)
+        p.save_pdf()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("output", help="output file")
+    parser.add_argument("output", nargs='?', help="output file")
     parser.add_argument("-p","--profession", help="profession")
     parser.add_argument("-b","--bonus", help="bonus")
-    parser.add_argument("-n","--number", help="number of characters per profession")
+    parser.add_argument("-n","--number", type=int, help="number of characters per profession")
     parser.add_argument("-s","--sex", help="sex (m,f,b)")
     parser.add_argument("-i","--index", help="index with bookmarks",action="store_true")
     parser.add_argument("-t","--text", help="text output",action="store_true")
+    parser.add_argument("-j","--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--background", choices=BACKGROUNDS, default='jpeg',
+                        help="character sheet background (vector needs pdfrw, "
+                             "stamp lays text-only pages over the vector sheet)")
+    parser.add_argument("-f","--format", choices=FORMATS, default='pdf',
+                        help="output format (columnar writes Parquet, needs pyarrow)")
+    parser.add_argument("--seed", help="seed for a reproducible roster")
+    parser.add_argument("--party", type=int, metavar="SIZE",
+                        help="build one party of SIZE agents meeting --need")
+    parser.add_argument("--need", type=need_spec, action="append",
+                        metavar="[N:|all:]SKILL>=VALUE",
+                        help="with --party, at least N agents (default 1) or "
+                             "all of them with SKILL at VALUE or more; "
+                             "may be repeated")
+    parser.add_argument("--budget", type=float, default=5.0, metavar="SECONDS",
+                        help="time --party may search for (default 5)")
+    parser.add_argument("--where", type=threshold_spec, action="append",
+                        metavar="SKILL>=VALUE",
+                        help="write only the agents with SKILL (or str, con, "
+                             "dex, int, pow, cha) at VALUE or more; may be "
+                             "repeated, needs numpy")
+    parser.add_argument("--distribution", action="store_true",
+                        help="write exact stat and skill probability tables "
+                             "per profession and bonus package instead of "
+                             "agents (CSV with -f csv, JSON otherwise)")
+    parser.add_argument("--unique-names", action="store_true",
+                        help="never give two agents the same name")
+    parser.add_argument("--stream", type=int, metavar="AGENTS",
+                        help="write the PDF to disk AGENTS pages at a time "
+                             "with bounded memory")
+    parser.add_argument("--split-by", type=split_spec, metavar="profession|count:N",
+                        help="write one PDF per profession or per N agents, "
+                             "named after the output file")
+    parser.add_argument("--manifest", metavar="JSON",
+                        help="with --split-by, list the files written")
+    parser.add_argument("--cache", nargs='?', const=PAGE_CACHE_DIR, metavar="DIR",
+                        help="reuse pages rendered by earlier seeded runs "
+                             "(default directory %(const)s), in chunks of "
+                             "--stream agents, " + str(CACHE_BLOCK) +
+                             " by default")
+    parser.add_argument("--recover", metavar="FILE",
+                        help="cut an interrupted --stream PDF back to its "
+                             "last complete chunk")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="serve agents over HTTP on host:port or a Unix socket path")
+    parser.add_argument("--stats", action="store_true",
+                        help="print time spent per rendering stage")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write cProfile stats (pstats format, e.g. for snakeviz or flameprof)")
     args = parser.parse_args()
+    if(args.stream is not None and args.stream < 1):
+        parser.error('--stream needs at least 1 agent per chunk')
+    if(args.split_by and args.format != 'pdf'):
+        parser.error('--split-by only applies to PDF output')
+    if(args.format != 'pdf' and (args.stream or args.jobs > 1)):
+        parser.error('--stream and --jobs only apply to PDF output')
+    if(args.split_by and args.stream):
+        parser.error('--stream only applies to single-file output')
+    if(args.cache and args.seed is None):
+        parser.error('--cache needs --seed, unseeded pages are never reused')
+    if(args.cache and args.format != 'pdf'):
+        parser.error('--cache only applies to PDF output')
+    if(args.cache and args.split_by):
+        parser.error('--cache only applies to single-file output')
+    if(args.party is not None and args.party < 1):
+        parser.error('--party needs at least 1 agent')
+    if(args.need and not args.party):
+        parser.error('--need needs --party')
+    if(args.party and (args.split_by or args.stream or args.cache)):
+        parser.error('--party writes one small file, without --split-by, '
+                     '--stream or --cache')
+    if(args.where and (args.party or args.distribution or args.split_by
+                       or args.stream or args.cache or args.jobs > 1)):
+        parser.error('--where filters one roster, without --party, '
+                     '--distribution, --split-by, --stream, --cache or '
+                     '--jobs')
+    if(args.unique_names):
+        # Every agent is numbered within its profession, a party's too
+        limit = min(UniqueNames().capacity(g) for g in ('male', 'female'))
+        if((args.party or args.number or 1) > limit):
+            parser.error('--unique-names can name at most %d agents per '
+                         'profession' % limit)
+
+    if(args.serve):
+        serve(args.serve, args.jobs, args.background)
+        raise SystemExit
+    if(args.recover):
+        print('dropped %d bytes' % recover_pdf(args.recover))
+        raise SystemExit
     
     filename = 'DeltaGreenPregen.pdf'
     if(args.output):
@@ -1284,45 +4011,37 @@ if __name__ == '__main__':
         number = args.number
         
     sex = choice(['m','f'])
+    if(args.seed is not None):
+        sex = random.Random(args.seed).choice(['m','f'])
     if(args.sex):
         sex = args.sex
         
     profession_list = PROFESSIONS
     if(args.profession):
         profession_list = []
-        for prof in PROFESSIONS:
-            if args.profession.upper() in prof.upper():
-                profession_list.append(prof)
-                break
+        prof = match_profession(args.profession)
+        if prof is not None:
+            profession_list.append(prof)
 
     bonus_package = 'random'
     if(args.bonus):
         bonus_package = args.bonus
     
-    
-    total = None
-    if(args.index):
-        total = number
-        if(sex == 'b'):
-            total = 2*number
-        
     print('professions: ',profession_list)
     print('bonus_package: ',bonus_package)
     print('sex: ',sex)
     
-    
-    p = Need2KnowPDF(filename, profession_list, total)
-    for profession in profession_list:
-        p.bookmark(profession)
-        for x in range(number):
-            if(sex == 'f' or sex == 'b'):
-                c = Need2KnowCharacter(gender='female', profession=profession, bonus_package = bonus_package)
-                p.add_page(c)
-                if(args.text):
-                    c.dump()
-            if(sex == 'm' or sex == 'b'):
-                c = Need2KnowCharacter(gender='male', profession=profession, bonus_package = bonus_package)
-                p.add_page(c)
-                if(args.text):
-                    c.dump()
-    p.save_pdf()
+    timings = None
+    if(args.stats):
+        timings = Timings()
+        instrument(timings)
+    started = time.perf_counter()
+    roster = (args, filename, profession_list, number, sex, bonus_package)
+    if(args.profile):
+        profiler = cProfile.Profile()
+        profiler.runcall(write_roster, *roster)
+        profiler.dump_stats(args.profile)
+    else:
+        write_roster(*roster)
+    if(timings):
+        timings.report(time.perf_counter() - started)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+
+# Checks that seeded output is the same whichever way it is produced.
+# Run with pytest from this directory.
+
+import ast
+import csv
+import io
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+
+import pytest
+from PyPDF2 import PdfFileReader
+
+import generator
+from generator import (BONUS_REGISTRY, PROFESSION_REGISTRY, PROFESSIONS,
+                       AliasTable, CharacterRecord, Need2KnowCharacter,
+                       Roster, UniqueNames, boost_odds, build_party,
+                       generate, render_party, roster_slice,
+                       skill_distribution)
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generator.py')
+
+# Every run renders the same seeded roster; -s m so that the agents are
+# also those of a service party, see test_render_party_matches_roster
+ROSTER = ['-n', '2', '-s', 'm', '--seed', 'paths']
+
+# Ways to write the roster: serial, sharded, streamed and cached
+PATHS = {
+    'serial': [],
+    'jobs': ['-j', '2'],
+    'stream': ['--stream', '3'],
+    'stream-jobs': ['--stream', '3', '-j', '2'],
+    'cache': ['--cache'],
+    'cache-stream': ['--stream', '3', '--cache'],
+}
+
+
+def run_cli(directory, name, *args):
+    # Write a roster with generator.py in a child process
+    output = os.path.join(str(directory), name + '.pdf')
+    subprocess.run([sys.executable, SCRIPT, output] + list(args), check=True,
+                   stdout=subprocess.DEVNULL)
+    return output
+
+
+def read_pdf(data):
+    # (text of every page, (title, page number) of every outline entry)
+    if isinstance(data, str):
+        with open(data, 'rb') as f:
+            data = f.read()
+    reader = PdfFileReader(io.BytesIO(data))
+    pages = [reader.getPage(n).extractText()
+             for n in range(reader.getNumPages())]
+    outline = [(entry['/Title'], reader.getDestinationPageNumber(entry))
+               for entry in reader.getOutlines()]
+    return pages, outline
+
+
+@pytest.fixture(scope='module')
+def serial(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('serial')
+    return (read_pdf(run_cli(directory, 'plain', *ROSTER)),
+            read_pdf(run_cli(directory, 'index', '-i', *ROSTER)))
+
+
+@pytest.mark.parametrize('path', sorted(PATHS))
+def test_render_paths_match_serial(serial, tmp_path, path):
+    args = list(PATHS[path])
+    cached = '--cache' in args
+    if cached:
+        args.append(str(tmp_path / 'pages'))
+    for expected, index in zip(serial, ([], ['-i'])):
+        # The second cached run reads every chunk back
+        for run in range(2 if cached else 1):
+            got = read_pdf(run_cli(tmp_path, '%s-%d' % (path, run),
+                                   *(index + args + ROSTER)))
+            # The Table of Contents page carries the time of the run
+            assert got[0][len(index):] == expected[0][len(index):]
+            assert got[1] == expected[1]
+
+
+def test_render_party_matches_roster(serial):
+    # A service party of the roster's professions, each twice, holds the
+    # roster's agents page for page
+    profession_list = [p for p in PROFESSIONS for x in range(2)]
+    content_type, body = render_party(profession_list, 'm', 'random',
+                                      seed='paths')
+    assert read_pdf(body)[0] == serial[0][0]
+
+
+def party_json(profession_list, sex='f', seed='party'):
+    content_type, body = render_party(profession_list, sex, 'random', 'json',
+                                      seed=seed)
+    return json.loads(body.decode('utf-8'))
+
+
+def test_party_of_one_profession_has_no_duplicates():
+    party = party_json(['Nurse'] * 3)
+    assert len(set(agent['name'] for agent in party)) == 3
+    assert len(set(json.dumps(agent, sort_keys=True)
+                   for agent in party)) == 3
+
+
+def test_party_repeats_are_the_roster_agents():
+    # The nth Nurse of a party is agent #n of -p Nurse with the same seed
+    party = party_json(['Nurse'] * 3)
+    roster = [dict(c.d.items())
+              for c in generate(['Nurse'], 3, 'f', 'random', 'party')]
+    assert party == roster
+
+
+def test_random_seeded_party_has_no_duplicates():
+    for seed in range(20):
+        # As GeneratorHandler picks professions for a random party
+        rng = random.Random(str(seed))
+        profession_list = [rng.choice(PROFESSIONS) for x in range(24)]
+        assert len(set(profession_list)) < len(profession_list)
+        party = party_json(profession_list, 'm', str(seed))
+        assert len(set(json.dumps(agent, sort_keys=True)
+                       for agent in party)) == len(party)
+
+
+# A bonus package with a free pick between two fixed pools, so the free
+# pick draws from a different remainder in each branch of the first
+SPLIT_PACKAGE = generator._compile_bonus_package({
+    'skills': ('alertness',),
+    'picks': (
+        (('athletics', 'swim'), 1),
+        (None, 1),
+        (('swim', 'dodge'), 1),
+    ),
+})
+
+
+def within(p, count, samples):
+    # count of samples agrees with probability p to four standard errors
+    sigma = (float(p) * (1 - float(p)) / samples) ** 0.5
+    return abs(count / samples - float(p)) <= 4 * sigma + 1e-3
+
+
+def test_boost_odds_match_monte_carlo(monkeypatch):
+    monkeypatch.setitem(BONUS_REGISTRY, 'split', SPLIT_PACKAGE)
+    monkeypatch.setattr(generator, '_DISTRIBUTIONS', {})
+    # Few free candidates, so that each branch's remainder matters
+    monkeypatch.setattr(generator, 'POSSIBLE_BONUS_SKILLS',
+                        ['alertness', 'athletics', 'dodge', 'stealth',
+                         'swim'])
+    samples = 20000
+    agents = [Need2KnowCharacter('male', 'Nurse', 'split', seed='mc/%d' % n)
+              for n in range(samples)]
+    odds = boost_odds('Nurse', 'split')
+    for skill in generator.POSSIBLE_BONUS_SKILLS:
+        count = sum(skill in agent.bonus_skills for agent in agents)
+        assert within(odds.get(skill, 0), count, samples), skill
+    tables = skill_distribution('Nurse', 'split')
+    for field in ('swim', 'athletics', 'dodge', 'alertness', 'medicine'):
+        for value, p in tables[field].items():
+            count = sum(agent.d.get(field) == value for agent in agents)
+            assert within(p, count, samples), (field, value)
+
+
+def test_unique_names_are_distinct_and_survive_pickling(monkeypatch):
+    # Small tables, so that every slot of both name spaces can be named;
+    # Sam is on both given name lists
+    monkeypatch.setattr(generator, '_TABLES', {
+        'SURNAMES': ['Surname%d' % n for n in range(11)] + [''],
+        'MALES': ['Abe', 'Bob', 'Cy', 'Dan', 'Sam', 'Bob'],
+        'FEMALES': ['Eve', 'Flo', 'Gil', 'Sam'],
+    })
+    names = UniqueNames('k')
+    copy = pickle.loads(pickle.dumps(names))
+    seen = set()
+    for gender in ('male', 'female'):
+        size = names.space(gender)[-1]
+        assert names.capacity(gender) == size // len(PROFESSIONS) > 0
+        for slot in range(size):
+            index, p = divmod(slot, len(PROFESSIONS))
+            name = names.name(PROFESSIONS[p], gender, index)
+            assert copy.name(PROFESSIONS[p], gender, index) == name
+            seen.add(name)
+        with pytest.raises(ValueError):
+            names.name(PROFESSIONS[0], gender, size // len(PROFESSIONS) + 1)
+    size = sum(names.space(g)[-1] for g in ('male', 'female'))
+    assert len(seen) == size
+
+
+# Each profession twice per sex, as roster_agents() numbers them
+ROSTER_AGENTS = list(roster_slice(PROFESSIONS, 2, 'b', 'random', 'roster',
+                                  0, 4 * len(PROFESSIONS)))
+
+QUERIES = [
+    ((), None),
+    ((), 'Nurse'),
+    ((('power', 12),), None),
+    ((('strength', 10), ('dexterity', 12)), None),
+    ((('firearms', 40),), 'Soldier'),
+    # Skills most agents lack, and a threshold nobody reaches
+    ((('pilot2', 30),), None),
+    ((('occult', 1),), 'Anthropologist'),
+    ((('dodge', 101),), None),
+]
+
+
+def matching(agents, thresholds=(), profession=None):
+    # Positions of the agents meeting the query, one agent at a time
+    return [n for n, agent in enumerate(agents)
+            if (profession is None or agent.d['profession'] == profession)
+            and all(field in agent.d and agent.d[field] >= threshold
+                    for field, threshold in thresholds)]
+
+
+@pytest.mark.parametrize('thresholds, profession', QUERIES)
+def test_roster_query_matches_brute_force(thresholds, profession):
+    pytest.importorskip('numpy')
+    roster = Roster(ROSTER_AGENTS)
+    assert list(roster.query(thresholds, profession)) == matching(
+        ROSTER_AGENTS, thresholds, profession)
+
+
+def test_roster_indexes_follow_appends():
+    numpy = pytest.importorskip('numpy')
+    half = len(ROSTER_AGENTS) // 2
+    roster = Roster(ROSTER_AGENTS[:half])
+    for thresholds, profession in QUERIES:
+        roster.query(thresholds, profession)
+    # The indexes built above must not answer for the new agents
+    roster.extend(ROSTER_AGENTS[half:])
+    for field, threshold in [('power', 12), ('pilot2', 30), ('dodge', 101)]:
+        bits = numpy.unpackbits(roster.at_least(field, threshold),
+                                count=len(roster))
+        assert list(numpy.flatnonzero(bits)) == matching(
+            ROSTER_AGENTS, [(field, threshold)])
+    bits = numpy.unpackbits(roster.having('profession', 'Nurse'),
+                            count=len(roster))
+    assert list(numpy.flatnonzero(bits)) == matching(ROSTER_AGENTS,
+                                                      profession='Nurse')
+
+
+def test_roster_agents_round_trip():
+    pytest.importorskip('numpy')
+    roster = Roster(ROSTER_AGENTS)
+    for agent, stored in zip(ROSTER_AGENTS, roster.agents()):
+        assert list(stored.d.items()) == list(agent.d.items())
+        assert stored.bonus_skills == agent.bonus_skills
+        assert stored.seed == agent.seed
+
+
+def alias_odds(table):
+    # Exact probability of each index: its own column's share plus what
+    # the columns aliased to it hand over
+    odds = list(table.prob)
+    for n, alias in enumerate(table.alias):
+        odds[alias] += 1 - table.prob[n]
+    return [p / table.count for p in odds]
+
+
+def test_alias_table_draws_by_weight():
+    weights = [1, 0, 3, 6, 0.5, 2]
+    table = AliasTable.build(weights)
+    expected = [w / sum(weights) for w in weights]
+    assert alias_odds(table) == pytest.approx(expected)
+    rng = random.Random('alias')
+    samples = 50000
+    draws = [table.draw(rng) for x in range(samples)]
+    for n, p in enumerate(expected):
+        assert within(p, draws.count(n), samples), n
+
+
+def test_alias_cache_follows_its_sources(monkeypatch, tmp_path):
+    monkeypatch.setattr(generator, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(generator, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(generator, '_TABLES', {})
+    monkeypatch.setitem(generator.TABLE_FILES, 'TEST', 'test.txt')
+    monkeypatch.setitem(generator.WEIGHT_FILES, 'TEST', 'test.weights')
+    (tmp_path / 'test.txt').write_text('a\nb\nc\n')
+    (tmp_path / 'test.weights').write_text('a\t1\nc\t3\nz\t5\n')
+    assert alias_odds(generator.load_weights('TEST')) == pytest.approx(
+        [0.25, 0, 0.75])
+    # The second load reads the cache rather than building again
+    with monkeypatch.context() as m:
+        m.setattr(AliasTable, 'build', None)
+        assert alias_odds(generator.load_weights('TEST')) == pytest.approx(
+            [0.25, 0, 0.75])
+    # New weights make the cache stale
+    (tmp_path / 'test.weights').write_text('b\t1\n')
+    assert alias_odds(generator.load_weights('TEST')) == pytest.approx(
+        [0, 1, 0])
+
+
+def test_build_party_meets_needs():
+    needs = [('medicine', 50, 2), ('firearms', 50, 1)]
+    party, unmet = build_party(3, needs, ['Nurse', 'Physician', 'Soldier'],
+                               seed='party')
+    assert len(party) == 3 and unmet == []
+    for skill, threshold, count in needs:
+        assert sum(agent.d.get(skill, 0) >= threshold
+                   for agent in party) >= count
+
+
+def test_build_party_reports_unmet_needs():
+    professions = ['Nurse', 'Physician', 'Soldier']
+    party, unmet = build_party(2, [('medicine', 50, 1), ('medicine', 40, 3),
+                                   ('unnatural', 1, 1)],
+                               professions, seed='party')
+    assert len(party) == 2
+    assert unmet == [
+        (('medicine', 40, 3), 'needs 3 agents, the party has 2'),
+        (('unnatural', 1, 1),
+         'no allowed profession and bonus package reaches it'),
+    ]
+    # Every agent needs medicine, which no one with firearms has
+    party, unmet = build_party(2, [('medicine', 50, None),
+                                   ('firearms', 50, 1)],
+                               professions, seed='party')
+    assert unmet == [(('firearms', 50, 1),
+                      'no allowed profession and bonus package reaches it '
+                      'together with all:medicine>=50')]
+    assert all(agent.d['medicine'] >= 50 for agent in party)
+
+
+def test_character_record_behaves_like_a_dict():
+    plain = {'name': 'DOE, Jane', 'strength': 12, 'medicine': 60,
+             'craft1label': 'Carpentry', 'craft1value': 40}
+    record = CharacterRecord(plain)
+    assert dict(record) == plain and len(record) == len(plain)
+    # Text fields first, then numeric fields in sheet order
+    assert list(record)[:2] == ['name', 'craft1label']
+    assert list(record.items()) == [(key, record[key]) for key in record]
+    record['medicine'] = 70
+    record['profession'] = 'Nurse'
+    del record['strength']
+    del record['craft1label']
+    plain.update(medicine=70, profession='Nurse')
+    del plain['strength'], plain['craft1label']
+    assert dict(record) == plain and len(record) == len(plain)
+    assert 'strength' not in record and record.get('strength') is None
+    for key in ('strength', 'no such field'):
+        with pytest.raises(KeyError):
+            record[key]
+        with pytest.raises(KeyError):
+            del record[key]
+    assert CharacterRecord.from_dict(plain) == record
+
+
+def test_feature_table_matches_dict_lookup():
+    # The dict of (statistic, value) to features the table replaced
+    features = {}
+    with open(generator.data_path('distinguishing-features.csv')) as f:
+        for row in csv.DictReader(f):
+            for value in range(int(row['from']), int(row['to']) + 1):
+                features.setdefault((row['statistic'], value),
+                                    []).append(row['distinguishing'])
+    table = generator.load_table('DISTINGUISHING')
+    for stat in generator.FeatureTable.STATS + ('luck',):
+        for value in range(-2, 22):
+            key = (stat, value)
+            assert table.candidates(stat, value) == tuple(
+                features.get(key, ['']))
+            assert table.get(key) == features.get(key)
+
+
+# The commit whose Need2KnowCharacter spelled the skill tables out as
+# if-chains, before the registries
+BASELINE = '5a63bd1'
+
+# Bonus skills the baseline misspelt or ran together by a missing comma
+BASELINE_TYPOS = {
+    'fisrt aide': ('first aide',),
+    'computer use': ('computer science',),
+    'craft1valuelanguage1': ('craft1value', 'language1'),
+    'craft1valuelaw': ('craft1value', 'law'),
+    'forensicslanguage1': ('forensics', 'language1'),
+    'athleticsdrive': ('athletics', 'drive'),
+    'language2language3': ('language2', 'language3'),
+}
+
+
+def baseline_tables():
+    # (professions, bonus packages, free pick skills) read off the
+    # baseline's if-chains, in the form of the compiled registries
+    try:
+        source = subprocess.run(
+            ['git', 'show', BASELINE + ':generator.py'], check=True,
+            cwd=os.path.dirname(SCRIPT), stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL).stdout
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('baseline commit not available')
+    init = next(node for node in ast.walk(ast.parse(source))
+                if isinstance(node, ast.FunctionDef)
+                and node.name == '__init__')
+
+    def names(test, var):
+        # Names compared to var by an if, or-ed together
+        if isinstance(test, ast.BoolOp):
+            return sum((names(value, var) for value in test.values), [])
+        if isinstance(test.left, ast.Name) and test.left.id == var:
+            return [test.comparators[0].value]
+        return []
+
+    def constants(node):
+        # The elements of set([...])
+        return [ast.literal_eval(e) for e in node.args[0].elts]
+
+    professions, packages, possible = {}, {}, None
+    for stmt in init.body:
+        if isinstance(stmt, ast.Assign) and \
+                getattr(stmt.targets[0], 'id', None) == 'possible_bonus_skills':
+            possible = constants(stmt.value)
+        if not isinstance(stmt, ast.If):
+            continue
+        skills, choices, picks, bonds, labels = {}, [], [], 0, []
+        for line in stmt.body:
+            target, value = line.targets[0], line.value
+            if isinstance(target, ast.Subscript):
+                # self.d[...] = ...
+                if isinstance(value, ast.Constant):
+                    skills[target.slice.value] = value.value
+                elif getattr(value, 'slice', None) and \
+                        getattr(value.slice, 'value', None) == 'charisma':
+                    bonds += 1
+            elif getattr(target, 'id', None) == 'possible':
+                choices = constants(value)
+            elif isinstance(value, ast.Call) and \
+                    getattr(value.func, 'attr', None) == 'setLabelSkill':
+                labels.append(tuple(ast.literal_eval(a) for a in value.args))
+            elif isinstance(value, ast.Call) and \
+                    getattr(value.func, 'id', None) == 'set':
+                skills = [s for e in value.args[0].elts
+                          if isinstance(e, ast.Constant)
+                          for s in BASELINE_TYPOS.get(e.value, (e.value,))]
+            else:
+                # choice1, choice2 = sample(possible, 2), choice1 =
+                # sample(possible, 1)[0], bonus_skills = sample(possible
+                # _bonus_skills, 8) or bonus_skills.union(sample(...))
+                if isinstance(value, ast.Subscript):
+                    value = value.value
+                if getattr(value.func, 'attr', None) == 'union':
+                    value = value.args[0]
+                pool, count = value.args
+                picks.append((tuple(choices)
+                              if getattr(pool, 'id', None) == 'possible'
+                              else None, ast.literal_eval(count)))
+        for name in names(stmt.test, 'profession'):
+            professions[name] = (skills, sorted(choices),
+                                 sum(count for pool, count in picks), bonds)
+        for name in names(stmt.test, 'bonus_package'):
+            packages[name] = (labels, sorted(skills), picks)
+    return professions, packages, possible
+
+
+def test_registries_match_baseline():
+    professions, packages, possible = baseline_tables()
+    assert sorted(generator.POSSIBLE_BONUS_SKILLS) == sorted(possible)
+    assert sorted(PROFESSION_REGISTRY) == sorted(professions)
+    for name, (skills, choices, picks, bonds) in PROFESSION_REGISTRY.items():
+        assert (skills, sorted(choices), picks, len(bonds)) == \
+            professions[name], name
+    assert sorted(BONUS_REGISTRY) == sorted(packages)
+    for name, (labels, skills, picks) in BONUS_REGISTRY.items():
+        assert (list(labels), sorted(skills), list(picks)) == \
+            packages[name], name